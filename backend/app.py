@@ -4,15 +4,31 @@
 #
 
 import os
-import requests
+import json
+import multiprocessing
+import time
+import gzip
+import base64
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime
 import traceback
-import psycopg2
-from flask import Flask, request, jsonify
+from psycopg2.extras import execute_values
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 from apscheduler.schedulers.background import BackgroundScheduler
 import yfinance as yf
 import pandas as pd
 import pandas_ta as ta
+from market_data import OHLCVCache, clean_yfinance_data, fetch_watchlist_data
+from indicators import IncrementalIndicators
+from db import ConnectionPool
+from live_stream import LocalBroker
+from notifications import DiscordDispatcher
+from bar_schedule import BarCloseSchedule, bar_end_times, session_times
+from backtest import BACKTEST_ENGINES, compact_portfolio_arrays, expand_sweep_grid, run_parameter_sweep, run_portfolio_backtest
+from metrics import STAGE_METRICS, timed
+from schema import PNL_UPSERT_SQL, migrate, pnl_summary_rows
+from payloads import DEFAULT_CHART_COLUMNS, DEFAULT_EQUITY_POINTS, MAX_EQUITY_POINTS, TRADE_COLUMNS, columnar_backtest_response, equity_to_columns, records_to_columns
 
 app = Flask(__name__)
 CORS(app, origins=["https://killo.online", "https://trading-dashboard-project.vercel.app"])
@@ -21,6 +37,20 @@ CORS(app, origins=["https://killo.online", "https://trading-dashboard-project.ve
 DATABASE_URL = os.getenv('DATABASE_URL')
 DISCORD_WEBHOOK_URL = os.getenv('DISCORD_WEBHOOK_URL')
 TRADING_BOT_API_KEY = os.getenv('TRADING_BOT_API_KEY')
+REDIS_URL = os.getenv('REDIS_URL')
+MAX_SWEEP_RUNS = int(os.getenv('MAX_SWEEP_RUNS', 1000))
+WORKER_THREADS = int(os.getenv('WORKER_THREADS', 8))
+FETCH_TIMEOUT = float(os.getenv('FETCH_TIMEOUT', 15))
+CYCLE_BUDGET = float(os.getenv('CYCLE_BUDGET', 50))
+STRAGGLER_MS = float(os.getenv('STRAGGLER_MS', 2000))
+SCHEDULER_TICK_SECONDS = int(os.getenv('SCHEDULER_TICK_SECONDS', 15))
+BAR_CLOSE_GRACE = float(os.getenv('BAR_CLOSE_GRACE', 20))
+EXIT_CHECK_SECONDS = float(os.getenv('EXIT_CHECK_SECONDS', 60))
+COMPRESS_MIN_BYTES = int(os.getenv('COMPRESS_MIN_BYTES', 1024))
+RUN_SCHEDULER = os.getenv('RUN_SCHEDULER', '1') == '1'
+MIGRATE_ON_START = os.getenv('MIGRATE_ON_START', '1') == '1'
+DISCORD_SPOOL_PATH = os.getenv('DISCORD_SPOOL_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.discord_spool.jsonl'))
+OHLCV_STORE_DIR = os.getenv('OHLCV_STORE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.ohlcv_store'))
 
 WATCHLIST = [
     # --- Forex ---
@@ -110,17 +140,14 @@ WATCHLIST = [
 ]
 
 
-def get_db_connection():
-    try:
-        conn = psycopg2.connect(DATABASE_URL)
-        return conn
-    except Exception as e:
-        print(f"Database connection error: {e}")
-        return None
+# One pool shared by the worker and the API routes; connections are opened lazily
+DB_POOL = ConnectionPool(DATABASE_URL, int(os.getenv('DB_POOL_MIN', 1)), int(os.getenv('DB_POOL_MAX', 10)))
 
 # --- DISCORD NOTIFICATION LOGIC ---
-def send_discord_notification(trade_details, reason, strategy_name):
-    if not DISCORD_WEBHOOK_URL: return
+# Delivery happens on the dispatcher's thread; the worker only queues embeds
+DISCORD_DISPATCHER = DiscordDispatcher(DISCORD_WEBHOOK_URL, DISCORD_SPOOL_PATH) if DISCORD_WEBHOOK_URL else None
+
+def build_discord_embed(trade_details, reason, strategy_name):
     color = {"Entry": 3447003, "Take Profit": 3066993, "Stop Loss": 15158332}.get(reason, 10070709)
     title = f"🚀 New Entry: {trade_details['type']}" if reason == "Entry" else f"✅ Exit: {reason}"
     embed = {"title": title,"color": color,"fields": [{"name": "Symbol","value": trade_details['symbol'],"inline": True},{"name": "Strategy","value": strategy_name.replace('_', ' ').title(),"inline": True},{"name": "Timeframe","value": trade_details['timeframe'],"inline": True},{"name": "Entry Price","value": f"{trade_details['entry_price']:.5f}","inline": True}]}
@@ -130,23 +157,13 @@ def send_discord_notification(trade_details, reason, strategy_name):
         embed["fields"].extend([{"name": "Exit Price", "value": f"{trade_details['exit_price']:.5f}", "inline": True}, {"name": "Result", "value": f"{pnl_percent:+.2f}%", "inline": True}])
     else:
         embed["fields"].extend([{"name": "Stop Loss", "value": f"{trade_details['stop_loss']:.5f}", "inline": True}, {"name": "Take Profit", "value": f"{trade_details['take_profit']:.5f}", "inline": True}])
-    try:
-        requests.post(DISCORD_WEBHOOK_URL, json={"embeds": [embed]})
-    except Exception as e:
-        print(f"Error sending Discord notification: {e}")
+    return embed
 
-# --- ROBUST DATA CLEANING FUNCTION ---
-def clean_yfinance_data(df):
-    if isinstance(df.columns, pd.MultiIndex): df.columns = df.columns.droplevel(1)
-    df = df.reset_index()
-    df.columns = [col.lower() for col in df.columns]
-    # Reliably find and rename the date column
-    date_col_name = 'index'
-    if 'date' in df.columns: date_col_name = 'date'
-    if 'datetime' in df.columns: date_col_name = 'datetime'
-    df.rename(columns={date_col_name: 'time'}, inplace=True)
-    return df
+def send_discord_notification(trade_details, reason, strategy_name):
+    if DISCORD_DISPATCHER is None: return
+    DISCORD_DISPATCHER.enqueue(build_discord_embed(trade_details, reason, strategy_name))
 
+@timed('generate_signals')
 def generate_signals(df, strategy_name):
     # Explicitly tell pandas_ta which column to use for all calculations
     df.ta.ema(close=df['close'], length=5, append=True)
@@ -161,7 +178,10 @@ def generate_signals(df, strategy_name):
     
     # Force all resulting columns to lowercase again to be safe
     df.columns = [col.lower() for col in df.columns]
+    return apply_strategy_rules(df, strategy_name)
 
+def apply_strategy_rules(df, strategy_name):
+    # Expects the indicator columns from generate_signals (or IncrementalIndicators.latest_rows)
     # Use a safe method to initialize the signal column
     df = df.assign(signal='STAY_OUT')
     
@@ -183,132 +203,367 @@ def generate_signals(df, strategy_name):
         df.loc[short_score >= 3, 'signal'] = 'SHORT'
     return df
 
-# --- ADVANCED BACKTESTING ENGINE (WITH CORRECTED LOWERCASE COLUMN NAMES) ---
-def run_backtest_simulation(df, initial_capital, risk_per_trade, max_trades_per_day, atr_multiplier, target_multiplier, slippage_pips, commission_per_trade):
-    trades, capital, peak_capital, max_drawdown, position, daily_trade_count, slippage, warmup_period = [], initial_capital, initial_capital, 0.0, None, {}, slippage_pips * 0.0001, 50
-    equity_curve = []
-    for i in range(warmup_period, len(df)):
-        current, prev = df.iloc[i], df.iloc[i-1]
-        current_date = current['time'].date()
-        if current_date not in daily_trade_count: daily_trade_count[current_date] = 0
-        equity_curve.append({'time': current['time'], 'capital': capital})
-        if position:
-            exit_reason, exit_price = None, 0.0
-            if position['type'] == 'LONG':
-                if current['low'] <= position['stop_loss']: exit_reason, exit_price = "Stop Loss", position['stop_loss']
-                elif current['high'] >= position['take_profit']: exit_reason, exit_price = "Take Profit", position['take_profit']
-            elif position['type'] == 'SHORT':
-                if current['high'] >= position['stop_loss']: exit_reason, exit_price = "Stop Loss", position['stop_loss']
-                elif current['low'] <= position['take_profit']: exit_reason, exit_price = "Take Profit", position['take_profit']
-            if i == len(df) - 1 and not exit_reason: exit_reason, exit_price = "End of Period", current['close']
-            if exit_reason:
-                exit_price += (slippage if position['type'] == 'SHORT' else -slippage)
-                pnl = (exit_price - position['entry_price']) * position['position_size'] if position['type'] == 'LONG' else (position['entry_price'] - exit_price) * position['position_size']
-                pnl -= commission_per_trade; capital += pnl; peak_capital = max(peak_capital, capital)
-                drawdown = (peak_capital - capital) / peak_capital if peak_capital > 0 else 0
-                max_drawdown = max(max_drawdown, drawdown)
-                position.update({'exit_price': exit_price, 'pnl': pnl, 'exit_reason': exit_reason}); trades.append(position); position = None
-        if not position and prev['signal'] == 'STAY_OUT' and current['signal'] != 'STAY_OUT':
-            if daily_trade_count[current_date] >= max_trades_per_day: continue
-            atr_approx = (current['high'] - current['low']) * 0.7
-            if pd.isna(atr_approx) or atr_approx == 0: continue
-            entry_price = current['open'] + (slippage if current['signal'] == 'LONG' else -slippage)
-            if current['signal'] == 'LONG':
-                stop_loss = entry_price - (atr_approx * atr_multiplier)
-                take_profit = entry_price + (atr_approx * target_multiplier)
+# --- LIVE SIGNAL STREAM ---
+# Columns of a live_signals row as served by /api/live-signals and the stream
+SIGNAL_COLUMNS = ('id', 'symbol', 'strategy', 'timeframe', 'status', 'trade_type', 'entry_price', 'exit_price', 'stop_loss', 'take_profit', 'entry_date', 'exit_date', 'exit_reason')
+# With Redis, Flask-SSE fans events out across every web process; without it each process
+# streams its own worker's events. Either way clients need an async worker (gunicorn -k gevent)
+# so open streams don't each pin a sync worker.
+LIVE_BROKER = None if REDIS_URL else LocalBroker()
+if REDIS_URL:
+    from flask_sse import sse
+    app.config['REDIS_URL'] = REDIS_URL
+    app.register_blueprint(sse, url_prefix='/api/live-signals/stream')
+
+def publish_signal_deltas(deltas):
+    """Pushes ('open' | 'close', row) pairs to subscribed dashboards. Never raises into the worker."""
+    for op, row in deltas:
+        try:
+            # app.json matches jsonify's encoding of dates and decimals, so streamed rows look like polled ones
+            payload = app.json.dumps({"op": op, "signal": row})
+            if LIVE_BROKER is not None:
+                LIVE_BROKER.publish(payload, event_type='signal')
             else:
-                stop_loss = entry_price + (atr_approx * atr_multiplier)
-                take_profit = entry_price - (atr_approx * target_multiplier)
-            risk_amount = capital * (risk_per_trade / 100); price_diff = abs(entry_price - stop_loss)
-            position_size = risk_amount / price_diff if price_diff > 0 else 0
-            if position_size > 0:
-                daily_trade_count[current_date] += 1
-                position = {'entry_date': current['time'], 'type': current['signal'], 'entry_price': entry_price, 'stop_loss': stop_loss, 'take_profit': take_profit, 'position_size': position_size}
-    if not trades: return {"trades": [], "performance": {"totalReturn": 0, "winRate": 0, "profitFactor": 0, "totalTrades": 0, "avgWin": 0, "avgLoss": 0, "maxDrawdown": 0, "finalCapital": initial_capital}, "equityCurve": equity_curve, "error": "No trades were executed."}
-    total_return = ((capital - initial_capital) / initial_capital) * 100
-    wins = [t for t in trades if t['pnl'] > 0]; losses = [t for t in trades if t['pnl'] <= 0]
-    win_rate = (len(wins) / len(trades)) * 100 if trades else 0; total_profit = sum(t['pnl'] for t in wins); total_loss = abs(sum(t['pnl'] for t in losses))
-    profit_factor = total_profit / total_loss if total_loss > 0 else 999
-    return {"trades": trades, "performance": {"totalReturn": round(total_return, 2), "winRate": round(win_rate, 2), "profitFactor": round(profit_factor, 2), "totalTrades": len(trades), "avgWin": round(total_profit/len(wins) if wins else 0, 2), "avgLoss": round(total_loss/len(losses) if losses else 0, 2), "maxDrawdown": round(max_drawdown*100, 2), "finalCapital": round(capital, 2)}, "equityCurve": equity_curve}
+                with app.app_context(): sse.publish(json.loads(payload), type='signal')
+        except Exception:
+            traceback.print_exc()
 
 # --- WATCHLIST WORKER LOGIC (WITH CORRECTED LOWERCASE COLUMN NAMES) ---
+# Running indicator state per (symbol, timeframe), shared by both strategies. Four rows are kept
+# so the scalping crossover still has a previous bar once the forming bar is set aside.
+INDICATORS = IncrementalIndicators(keep_rows=4)
+# Which series have closed a bar since they were last evaluated
+BAR_SCHEDULE = BarCloseSchedule(grace=BAR_CLOSE_GRACE, exit_check=EXIT_CHECK_SECONDS)
+# Bounded pool for the cycle's downloads and per-series signal evaluation
+WORKER_POOL = ThreadPoolExecutor(max_workers=WORKER_THREADS, thread_name_prefix='watchlist')
+LAST_CYCLE_REPORT = {}
+
+def process_single_config(cfg, signals_df=None, active_trade_row=None):
+    """Decides what one config does this cycle. Returns an 'open'/'close' action for apply_worker_actions, or None."""
+    if signals_df is None:
+        data = yf.Ticker(cfg['symbol']).history(period='5d', interval=cfg['timeframe'], auto_adjust=True)
+        if data.empty: return None
+        signals_df = generate_signals(clean_yfinance_data(data), cfg['strategy'])
+    latest, prev = signals_df.iloc[-1], signals_df.iloc[-2]
+    if active_trade_row:
+        trade_id, trade_type, entry_price, stop_loss, take_profit = active_trade_row
+        exit_reason, exit_price = None, None
+        if trade_type == 'LONG' and latest['close'] >= take_profit: exit_reason, exit_price = "Take Profit", latest['close']
+        elif trade_type == 'LONG' and latest['close'] <= stop_loss: exit_reason, exit_price = "Stop Loss", latest['close']
+        elif trade_type == 'SHORT' and latest['close'] <= take_profit: exit_reason, exit_price = "Take Profit", latest['close']
+        elif trade_type == 'SHORT' and latest['close'] >= stop_loss: exit_reason, exit_price = "Stop Loss", latest['close']
+        if exit_reason:
+            notification = ({"symbol": cfg['symbol'], "type": trade_type, "timeframe": cfg['timeframe'], "entry_price": entry_price, "exit_price": exit_price}, exit_reason, cfg['strategy'])
+            return {"action": "close", "params": (exit_price, exit_reason, trade_id), "notification": notification}
+    elif prev['signal'] == 'STAY_OUT' and latest['signal'] != 'STAY_OUT':
+        atr = latest['bbu_20_2.0'] - latest['bbl_20_2.0']
+        if pd.isna(atr) or atr == 0: return None
+        entry_price = latest['close']; stop_loss = entry_price - atr if latest['signal'] == 'LONG' else entry_price + atr; take_profit = entry_price + (atr * 1.5) if latest['signal'] == 'LONG' else entry_price - (atr * 1.5)
+        trade = {"symbol": cfg['symbol'], "type": latest['signal'], "timeframe": cfg['timeframe'], "entry_price": entry_price, "stop_loss": stop_loss, "take_profit": take_profit}
+        return {"action": "open", "params": (cfg['symbol'], cfg['strategy'], cfg['timeframe'], latest['signal'], entry_price, stop_loss, take_profit), "notification": (trade, "Entry", cfg['strategy'])}
+    return None
+
+def load_active_trades():
+    """All open trades in one query, keyed by (symbol, strategy, timeframe)."""
+    with DB_POOL.cursor() as cur:
+        cur.execute("SELECT id, symbol, strategy, timeframe, trade_type, entry_price, stop_loss, take_profit FROM live_signals WHERE status = 'active';")
+        rows = cur.fetchall()
+    active_trades = {}
+    for trade_id, symbol, strategy, timeframe, trade_type, entry_price, stop_loss, take_profit in rows:
+        # NUMERIC columns come back as Decimal; the worker compares them against float closes
+        active_trades.setdefault((symbol, strategy, timeframe), (trade_id, trade_type, float(entry_price), float(stop_loss), float(take_profit)))
+    return active_trades
+
+@timed('apply_worker_actions')
+def apply_worker_actions(actions):
+    """Writes a cycle's exits and entries in one transaction, then publishes them to the live stream and notifies."""
+    closes = [a['params'] for a in actions if a['action'] == 'close']
+    opens = [a['params'] for a in actions if a['action'] == 'open']
+    if not closes and not opens: return
+    deltas = []
+    with DB_POOL.cursor() as cur:
+        if closes:
+            rows = execute_values(cur, f"UPDATE live_signals AS s SET status = 'closed', exit_price = v.exit_price, exit_date = NOW(), exit_reason = v.exit_reason FROM (VALUES %s) AS v (exit_price, exit_reason, id) WHERE s.id = v.id AND s.status = 'active' RETURNING {', '.join('s.' + c for c in SIGNAL_COLUMNS)};", closes, template="(%s::numeric, %s::text, %s::integer)", fetch=True)
+            # Only rows this call actually closed come back, so a repeated close is never counted twice
+            closed = [dict(zip(SIGNAL_COLUMNS, row)) for row in rows]
+            deltas.extend(('close', row) for row in closed)
+            # The PnL summary moves in the same transaction as the exits it counts
+            summary = pnl_summary_rows(closed)
+            if summary: execute_values(cur, PNL_UPSERT_SQL, summary, template="(%s, %s, %s, %s, %s, %s, %s, %s)")
+        if opens:
+            rows = execute_values(cur, f"INSERT INTO live_signals (symbol, strategy, timeframe, status, trade_type, entry_price, stop_loss, take_profit, entry_date) VALUES %s RETURNING {', '.join(SIGNAL_COLUMNS)};", opens, template="(%s, %s, %s, 'active', %s, %s, %s, %s, NOW())", fetch=True)
+            deltas.extend(('open', dict(zip(SIGNAL_COLUMNS, row))) for row in rows)
+    publish_signal_deltas(deltas)
+    for action in actions:
+        send_discord_notification(*action['notification'])
+
+@timed('evaluate_series')
+def evaluate_series(key, configs, clean_df, active_trades, now):
+    """
+    Advances one (symbol, timeframe)'s indicators and runs its configs. Configs with an open trade
+    check their exits against the live close; the others look for entries on closed bars only, and
+    only when a bar has closed since the series was last evaluated. Returns (actions, per-config ms,
+    end of the newly evaluated bar or None); the caller marks that bar evaluated once it keeps the actions.
+    """
+    started = time.perf_counter()
+    rows = INDICATORS.latest_rows(key, clean_df)
+    # Bar ends come from the same alignment as the schedule's boundaries, DST days included; times
+    # are put in the session timezone first so naive daily dates compare against the UTC `now`
+    ends = bar_end_times(session_times(key[0], rows['time']), key[1])
+    closed = (ends <= now).to_numpy()
+    closed_rows = rows[closed]
+    bar_end = ends[closed].iloc[-1] if len(closed_rows) >= 2 else None
+    new_bar = bar_end is not None and BAR_SCHEDULE.is_new_bar(key, bar_end)
+    indicator_ms = (time.perf_counter() - started) * 1000
+    actions, latencies = [], {}
+    for config in configs:
+        config_started = time.perf_counter()
+        active_trade_row = active_trades.get((config['symbol'], config['strategy'], config['timeframe']))
+        if not active_trade_row and not new_bar: continue
+        try:
+            signal_rows = rows if active_trade_row else closed_rows
+            action = process_single_config(config, apply_strategy_rules(signal_rows, config['strategy']), active_trade_row)
+            if action: actions.append(action)
+        except Exception as e:
+            print(f"--- ERROR processing config {config} ---")
+            traceback.print_exc()
+        latencies[f"{config['symbol']} {config['strategy']} {config['timeframe']}"] = round(indicator_ms + (time.perf_counter() - config_started) * 1000, 2)
+    return actions, latencies, (bar_end if new_bar else None)
 
-def process_single_config(cfg):
-    conn = get_db_connection();
-    if not conn: return
-    cur = conn.cursor()
+@timed('check_all_signals')
+def check_all_signals():
+    """
+    The main scheduler job, run every SCHEDULER_TICK_SECONDS. Only series with a newly closed bar,
+    or with open trades due an exit check, are fetched and evaluated, on WORKER_POOL within CYCLE_BUDGET seconds.
+    """
+    cycle_started = time.perf_counter()
+    now = pd.Timestamp.now(tz='UTC')
+    report = {"started_at": now.isoformat(), "configs": len(WATCHLIST)}
     try:
-        cur.execute("SELECT id FROM live_signals WHERE status = 'active' AND symbol = %s AND strategy = %s AND timeframe = %s LIMIT 1;", (cfg['symbol'], cfg['strategy'], cfg['timeframe']))
-        active_trade_row = cur.fetchone()
-        data = yf.Ticker(cfg['symbol']).history(period='5d', interval=cfg['timeframe'], auto_adjust=True)
-        if data.empty: return
-        clean_df = clean_yfinance_data(data); signals_df = generate_signals(clean_df, cfg['strategy'])
-        latest, prev = signals_df.iloc[-1], signals_df.iloc[-2]
-        if active_trade_row:
-            trade_id, trade_type, entry_price, stop_loss, take_profit = active_trade_row
-            exit_reason, exit_price = None, None
-            if trade_type == 'LONG' and latest['close'] >= take_profit: exit_reason, exit_price = "Take Profit", latest['close']
-            elif trade_type == 'LONG' and latest['close'] <= stop_loss: exit_reason, exit_price = "Stop Loss", latest['close']
-            elif trade_type == 'SHORT' and latest['close'] <= take_profit: exit_reason, exit_price = "Take Profit", latest['close']
-            elif trade_type == 'SHORT' and latest['close'] >= stop_loss: exit_reason, exit_price = "Stop Loss", latest['close']
-            if exit_reason:
-                cur.execute("UPDATE live_signals SET status = 'closed', exit_price = %s, exit_date = NOW(), exit_reason = %s WHERE id = %s;", (exit_price, exit_reason, trade_id)); conn.commit()
-                send_discord_notification({"symbol": cfg['symbol'], "type": trade_type, "timeframe": cfg['timeframe'], "entry_price": entry_price, "exit_price": exit_price}, exit_reason, cfg['strategy'])
-        elif not active_trade_row and prev['signal'] == 'STAY_OUT' and latest['signal'] != 'STAY_OUT':
-            atr = latest['bbu_20_2.0'] - latest['bbl_20_2.0']
-            if pd.isna(atr) or atr == 0: return
-            entry_price = latest['close']; stop_loss = entry_price - atr if latest['signal'] == 'LONG' else entry_price + atr; take_profit = entry_price + (atr * 1.5) if latest['signal'] == 'LONG' else entry_price - (atr * 1.5)
-            trade = {"symbol": cfg['symbol'], "type": latest['signal'], "timeframe": cfg['timeframe'], "entry_price": entry_price, "stop_loss": stop_loss, "take_profit": take_profit}
-            cur.execute("INSERT INTO live_signals (symbol, strategy, timeframe, status, trade_type, entry_price, stop_loss, take_profit, entry_date) VALUES (%s, %s, %s, 'active', %s, %s, %s, %s, NOW());", (cfg['symbol'], cfg['strategy'], cfg['timeframe'], latest['signal'], entry_price, stop_loss, take_profit)); conn.commit()
-            send_discord_notification(trade, "Entry", cfg['strategy'])
+        active_trades = load_active_trades()
     except Exception as e:
-        traceback.print_exc()
-    finally:
-        if conn: cur.close(); conn.close()
+        print(f"--- Could not load active trades, skipping cycle: {e} ---")
+        return
 
-def check_all_signals():
-    """The main scheduler job. Loops through the watchlist."""
-    print(f"--- Worker running. Checking {len(WATCHLIST)} configurations. ---")
+    configs_by_series = {}
     for config in WATCHLIST:
+        configs_by_series.setdefault((config['symbol'], config['timeframe']), []).append(config)
+    bar_closed = {key for key in configs_by_series if BAR_SCHEDULE.is_due(key, now)}
+    exit_checks = {(symbol, timeframe) for symbol, _, timeframe in active_trades if (symbol, timeframe) in configs_by_series and BAR_SCHEDULE.exit_check_due((symbol, timeframe), now)}
+    due = bar_closed | exit_checks
+    report.update({"due_series": len(due), "bar_closed": len(bar_closed), "exit_checks": len(exit_checks)})
+    if not due:
+        report["wall_ms"] = round((time.perf_counter() - cycle_started) * 1000, 2)
+        LAST_CYCLE_REPORT.clear(); LAST_CYCLE_REPORT.update(report)
+        return
+    print(f"--- Worker running. {len(bar_closed)} series closed a bar, {len(exit_checks)} have open trades to check. ---")
+
+    # Fetch each due (symbol, timeframe) series once per cycle and share it across strategies, with
+    # enough bars that the indicators are warmed up whether or not their state survived a restart
+    fetch_stats = {}
+    market_data = fetch_watchlist_data(WATCHLIST, executor=WORKER_POOL, timeout=FETCH_TIMEOUT, stats=fetch_stats, only=due, min_bars=INDICATORS.warmup_bars)
+    report.update({"fetch_ms": round((time.perf_counter() - cycle_started) * 1000, 2), "fetch_intervals_ms": {k: round(v, 2) for k, v in fetch_stats['intervals_ms'].items()}, "fetch_timed_out": fetch_stats['timed_out']})
+
+    futures, skipped = {}, []
+    for key in due:
+        clean_df = market_data.get(key)
+        if clean_df is None or len(clean_df) < 2:
+            skipped.append(f"{key[0]} {key[1]}")
+            continue
+        futures[WORKER_POOL.submit(evaluate_series, key, configs_by_series[key], clean_df, active_trades, now)] = key
+    done, pending = wait(futures, timeout=max(0.0, CYCLE_BUDGET - (time.perf_counter() - cycle_started)))
+
+    actions, latencies = [], {}
+    for future in done:
         try:
-            process_single_config(config) # This will now work
+            series_actions, series_latencies, evaluated_bar = future.result()
+            actions.extend(series_actions); latencies.update(series_latencies)
+            # Only here, not in the task: a task still running past the budget has its actions dropped
+            if evaluated_bar is not None: BAR_SCHEDULE.mark_evaluated(futures[future], evaluated_bar)
+            if futures[future] in exit_checks: BAR_SCHEDULE.mark_exit_checked(futures[future], now)
         except Exception as e:
-            print(f"--- ERROR processing config {config} ---")
+            print(f"--- ERROR evaluating {futures[future]} ---")
             traceback.print_exc()
+    for future in pending: future.cancel()
+    try:
+        apply_worker_actions(actions)
+    except Exception as e:
+        print(f"--- ERROR writing {len(actions)} worker actions ---")
+        traceback.print_exc()
+
+    report.update({
+        "wall_ms": round((time.perf_counter() - cycle_started) * 1000, 2),
+        "actions": len(actions),
+        "skipped_no_data": skipped,
+        "timed_out": [f"{key[0]} {key[1]}" for key in (futures[f] for f in pending)],
+        "stragglers": {name: ms for name, ms in latencies.items() if ms >= STRAGGLER_MS},
+        "slowest": dict(sorted(latencies.items(), key=lambda item: item[1], reverse=True)[:5]),
+        "config_ms": latencies,
+    })
+    LAST_CYCLE_REPORT.clear(); LAST_CYCLE_REPORT.update(report)
+    print(f"--- Cycle done in {report['wall_ms']:.0f}ms (fetch {report['fetch_ms']:.0f}ms), {len(latencies)} configs evaluated, {len(actions)} actions, {len(skipped)} skipped, {len(pending)} timed out. ---")
 
 # --- API ENDPOINTS ---
+@app.after_request
+def compress_response(response):
+    # Backtest payloads are large and very repetitive JSON; gzip them for clients that accept it.
+    # Streamed responses (SSE, sweep NDJSON) are left alone so their events aren't buffered.
+    if (response.direct_passthrough or response.is_streamed or response.status_code < 200 or response.status_code >= 300
+            or 'Content-Encoding' in response.headers or 'gzip' not in request.headers.get('Accept-Encoding', '')):
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES: return response
+    response.set_data(gzip.compress(data, compresslevel=6))
+    response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    return response
+
+OHLCV_CACHE = OHLCVCache(OHLCV_STORE_DIR)
+
+@app.route('/api/cache-stats', methods=['GET'])
+def cache_stats():
+    return jsonify(OHLCV_CACHE.get_stats())
+
+@app.route('/api/worker-stats', methods=['GET'])
+def worker_stats():
+    return jsonify(LAST_CYCLE_REPORT)
+
+@app.route('/api/db-pool-stats', methods=['GET'])
+def db_pool_stats():
+    return jsonify(DB_POOL.get_stats())
+
+@app.route('/api/notification-stats', methods=['GET'])
+def notification_stats():
+    return jsonify(DISCORD_DISPATCHER.get_stats() if DISCORD_DISPATCHER else {"enabled": False})
+
+@app.route('/api/metrics', methods=['GET'])
+def stage_metrics():
+    # Per-stage latency histograms; empty unless the process was started with STAGE_TIMING=1
+    return jsonify({"enabled": STAGE_METRICS.enabled, "stages": STAGE_METRICS.snapshot()})
+
 @app.route('/api/live-signals', methods=['GET'])
 def get_live_signals():
-    # (This function is unchanged and correct)
-    conn = get_db_connection(); signals = []
+    # ?since=<ISO timestamp> returns only rows opened or closed after it. Responses carry an ETag
+    # built from the newest id and exit time, so an unchanged table answers 304 after one tiny query.
+    # The ETag is weak because compress_response may gzip the body, which changes its bytes.
+    since = request.args.get('since')
+    try:
+        since_dt = datetime.fromisoformat(since) if since else None
+    except ValueError:
+        return jsonify({"error": f"Invalid 'since' timestamp '{since}'."}), 400
+    signals = []
+    try:
+        with DB_POOL.cursor() as cur:
+            cur.execute("SELECT MAX(id), MAX(exit_date) FROM live_signals;")
+            max_id, last_exit = cur.fetchone()
+            etag = f"{max_id or 0}-{last_exit.timestamp() if last_exit else 0}-{since or ''}"
+            if request.if_none_match.contains_weak(etag):
+                response = Response(status=304); response.set_etag(etag, weak=True); return response
+            if since_dt:
+                cur.execute(f"SELECT {', '.join(SIGNAL_COLUMNS)} FROM live_signals WHERE entry_date > %s OR exit_date > %s ORDER BY entry_date DESC LIMIT 100;", (since_dt, since_dt))
+            else:
+                cur.execute(f"SELECT {', '.join(SIGNAL_COLUMNS)} FROM live_signals ORDER BY entry_date DESC LIMIT 100;")
+            signals_data = cur.fetchall()
+            if cur.description is not None:
+                columns = [desc[0] for desc in cur.description]
+                signals = [dict(zip(columns, row)) for row in signals_data]
+    except Exception as e:
+        traceback.print_exc(); return jsonify({"error": str(e)}), 500
+    response = jsonify(signals)
+    response.set_etag(etag, weak=True)
+    # Lets browsers keep the body and revalidate it with If-None-Match on every poll
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+HISTORY_FILTERS = ('symbol', 'strategy', 'timeframe', 'status', 'trade_type')
+
+def encode_history_cursor(entry_date, signal_id):
+    return base64.urlsafe_b64encode(f"{entry_date.isoformat()}|{signal_id}".encode()).decode()
+
+def decode_history_cursor(cursor):
+    entry_date, signal_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+    return datetime.fromisoformat(entry_date), int(signal_id)
+
+@app.route('/api/live-signals/history', methods=['GET'])
+def live_signals_history():
+    # Newest first, keyset-paginated on (entry_date, id): pass the response's nextCursor as ?cursor=
+    # for the next page. Filters: symbol, strategy, timeframe, status, trade_type, and from/to on entry_date.
     try:
-        cur = conn.cursor()
-        cur.execute("SELECT id, symbol, strategy, timeframe, status, trade_type, entry_price, exit_price, stop_loss, take_profit, entry_date, exit_date, exit_reason FROM live_signals ORDER BY entry_date DESC LIMIT 100;")
-        signals_data = cur.fetchall()
-        if cur.description is not None:
-            columns = [desc[0] for desc in cur.description]
-            signals = [dict(zip(columns, row)) for row in signals_data]
+        limit = min(max(1, request.args.get('limit', 50, type=int)), 500)
+        conditions, params = [], []
+        for name in HISTORY_FILTERS:
+            if request.args.get(name): conditions.append(f"{name} = %s"); params.append(request.args[name])
+        if request.args.get('from'): conditions.append("entry_date >= %s"); params.append(datetime.fromisoformat(request.args['from']))
+        if request.args.get('to'): conditions.append("entry_date < %s"); params.append(datetime.fromisoformat(request.args['to']))
+        if request.args.get('cursor'): conditions.append("(entry_date, id) < (%s, %s)"); params.extend(decode_history_cursor(request.args['cursor']))
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": f"Invalid history query: {str(e)}"}), 400
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    try:
+        with DB_POOL.cursor() as cur:
+            # One extra row tells us whether another page exists
+            cur.execute(f"SELECT {', '.join(SIGNAL_COLUMNS)} FROM live_signals {where} ORDER BY entry_date DESC, id DESC LIMIT %s;", (*params, limit + 1))
+            signals = [dict(zip(SIGNAL_COLUMNS, row)) for row in cur.fetchall()]
     except Exception as e:
         traceback.print_exc(); return jsonify({"error": str(e)}), 500
-    finally:
-        if conn: cur.close(); conn.close()
-    return jsonify(signals)
+    next_cursor = encode_history_cursor(signals[limit - 1]['entry_date'], signals[limit - 1]['id']) if len(signals) > limit else None
+    return jsonify({"signals": signals[:limit], "nextCursor": next_cursor})
+
+@app.route('/api/live-signals/pnl', methods=['GET'])
+def live_signals_pnl():
+    # Per strategy/timeframe results of closed trades, read from the summary the worker maintains.
+    # Returns are in percent of entry price, so forex and crypto trades add up on the same scale.
+    conditions, params = [], []
+    for name in ('strategy', 'timeframe'):
+        if request.args.get(name): conditions.append(f"{name} = %s"); params.append(request.args[name])
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    try:
+        with DB_POOL.cursor() as cur:
+            cur.execute(f"SELECT strategy, timeframe, closed_trades, wins, total_return_pct, gross_profit_pct, gross_loss_pct, last_exit_date FROM live_signal_pnl {where} ORDER BY strategy, timeframe;", params)
+            rows = cur.fetchall()
+    except Exception as e:
+        traceback.print_exc(); return jsonify({"error": str(e)}), 500
+    summary = [{
+        "strategy": strategy, "timeframe": timeframe, "closedTrades": closed, "wins": wins,
+        "winRate": round(wins / closed * 100, 2) if closed else 0, "totalReturnPct": round(total, 4),
+        "avgReturnPct": round(total / closed, 4) if closed else 0, "profitFactor": round(profit / loss, 2) if loss > 0 else 999,
+        "lastExitDate": last_exit,
+    } for strategy, timeframe, closed, wins, total, profit, loss, last_exit in rows]
+    return jsonify(summary)
+
+if LIVE_BROKER is not None:
+    @app.route('/api/live-signals/stream', methods=['GET'])
+    def live_signals_stream():
+        last_event_id = request.headers.get('Last-Event-ID', type=int)
+        response = Response(LIVE_BROKER.stream(last_event_id), mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
 
 @app.route('/api/backtest', methods=['POST'])
 def backtest_route():
     config = request.get_json()
+    engine = BACKTEST_ENGINES.get(config.get('engine', 'array'))
+    if engine is None: return jsonify({"error": f"Unknown backtest engine '{config.get('engine')}'."}), 400
+    # "format": "columnar" returns parallel arrays instead of row objects, the equity curve thinned to
+    # "equityPoints" and only the "chartColumns" the client plots from the last "chartRows" bars
     try:
-        ticker = yf.Ticker(config['symbol'])
-        data = ticker.history(period=config['period'], interval=config['timeframe'], auto_adjust=True)
-        if data.empty: return jsonify({"error": f"No data for '{config['symbol']}'."}), 404
-        
-        # The new cleaning function handles everything perfectly.
-        clean_df = clean_yfinance_data(data)
+        chart_columns = list(config.get('chartColumns', DEFAULT_CHART_COLUMNS))
+        chart_rows = max(0, int(config.get('chartRows', 300)))
+        equity_points = min(max(3, int(config.get('equityPoints', DEFAULT_EQUITY_POINTS))), MAX_EQUITY_POINTS)
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid response options: {str(e)}"}), 400
+    try:
+        # Served from the OHLCV cache; only bars it doesn't have yet are downloaded
+        clean_df = OHLCV_CACHE.get(config['symbol'], config['period'], config['timeframe'])
+        if clean_df is None: return jsonify({"error": f"No data for '{config['symbol']}'."}), 404
         
         signals_df = generate_signals(clean_df, config['strategy'])
+        unknown_columns = [col for col in chart_columns if col not in signals_df.columns]
+        if unknown_columns: return jsonify({"error": f"Unknown chart columns: {', '.join(unknown_columns)}."}), 400
         
         # No more guessing is needed here. The column is now guaranteed to be 'time'.
-        results = run_backtest_simulation(
+        results = engine(
             signals_df, 
             float(config.get('initialCapital', 10000)),
             float(config.get('riskPerTrade', 2.0)),
@@ -319,6 +574,9 @@ def backtest_route():
             float(config.get('commission', 4.0))
         )
         
+        if config.get('format') == 'columnar':
+            return jsonify(columnar_backtest_response(results, signals_df, chart_columns, chart_rows, equity_points)), 200
+
         if "error" in results: 
             return jsonify({ "performance": results.get('performance'), "trades": [], "equityCurve": results['equityCurve'], "error": results['error'] }), 200
         
@@ -330,6 +588,84 @@ def backtest_route():
         traceback.print_exc()
         return jsonify({"error": f"A critical backend error occurred: {str(e)}"}), 500
 
+@app.route('/api/backtest/portfolio', methods=['POST'])
+def backtest_portfolio_route():
+    # Backtests many watchlist entries against one capital pool. "instruments" is a list of
+    # {symbol, strategy, timeframe[, period]} and defaults to the whole WATCHLIST; "maxOpenPositions"
+    # caps the trades open at once across all of them. Accepts "format": "columnar" like /api/backtest.
+    config = request.get_json()
+    instruments = config.get('instruments') or WATCHLIST
+    try:
+        max_open_positions = int(config.get('maxOpenPositions', 5))
+        equity_points = min(max(3, int(config.get('equityPoints', DEFAULT_EQUITY_POINTS))), MAX_EQUITY_POINTS)
+        labels = [{key: inst[key] for key in ('symbol', 'strategy', 'timeframe')} for inst in instruments]
+    except (TypeError, ValueError, KeyError) as e:
+        return jsonify({"error": f"Invalid portfolio: {str(e)}"}), 400
+    atr_multiplier, target_multiplier, slippage = float(config.get('atrMultiplier', 1.0)), float(config.get('targetMultiplier', 2.5)), float(config.get('slippage', 1.5))
+
+    def load(inst):
+        # Only the compact arrays outlive this call; the indicator frame is dropped straight away
+        clean_df = OHLCV_CACHE.get(inst['symbol'], inst.get('period', config.get('period', '60d')), inst['timeframe'])
+        if clean_df is None: return None
+        return compact_portfolio_arrays(generate_signals(clean_df, inst['strategy']), atr_multiplier, target_multiplier, slippage)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(WORKER_THREADS, len(labels)))) as pool:
+            compacted = list(pool.map(load, instruments))
+        loaded = [(label, arrays) for label, arrays in zip(labels, compacted) if arrays is not None]
+        skipped = [label for label, arrays in zip(labels, compacted) if arrays is None]
+        if not loaded: return jsonify({"error": "No data for any instrument.", "skipped": skipped}), 404
+        results = run_portfolio_backtest(
+            loaded,
+            float(config.get('initialCapital', 10000)),
+            float(config.get('riskPerTrade', 2.0)),
+            int(config.get('maxTradesPerDay', 5)),
+            float(config.get('commission', 4.0)),
+            max_open_positions
+        )
+        body = {"performance": results['performance'], "instruments": results['instruments'], "skipped": skipped}
+        if "error" in results: body["error"] = results["error"]
+        if config.get('format') == 'columnar':
+            body.update({"format": "columnar", "trades": records_to_columns(results['trades'], ['symbol', 'strategy', 'timeframe'] + TRADE_COLUMNS),
+                         "equityCurve": equity_to_columns(results['equityCurve'], equity_points),
+                         "equityPoints": {"total": len(results['equityCurve']), "returned": min(len(results['equityCurve']), equity_points)}})
+        else:
+            body.update({"trades": results['trades'], "equityCurve": results['equityCurve']})
+        return jsonify(body), 200
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"error": f"A critical backend error occurred: {str(e)}"}), 500
+
+@app.route('/api/backtest/sweep', methods=['POST'])
+def backtest_sweep_route():
+    # Same body as /api/backtest plus "sweep": {"atrMultiplier": [0.5, 1.0] or {"start", "stop", "step"}, ...}
+    # Streams newline-delimited JSON: progress lines, then one "result" line with the ranked runs.
+    config = request.get_json()
+    rank_by = config.get('rankBy', 'totalReturn')
+    try:
+        grid = expand_sweep_grid(config, MAX_SWEEP_RUNS)
+    except (ValueError, TypeError, KeyError) as e:
+        return jsonify({"error": f"Invalid sweep: {str(e)}"}), 400
+    if rank_by not in ('totalReturn', 'winRate', 'profitFactor', 'totalTrades', 'avgWin', 'avgLoss', 'maxDrawdown', 'finalCapital'):
+        return jsonify({"error": f"Cannot rank by '{rank_by}'."}), 400
+    try:
+        clean_df = OHLCV_CACHE.get(config['symbol'], config['period'], config['timeframe'])
+        if clean_df is None: return jsonify({"error": f"No data for '{config['symbol']}'."}), 404
+        # Signal once; every run in the sweep reuses this frame
+        signals_df = generate_signals(clean_df, config['strategy'])
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"error": f"A critical backend error occurred: {str(e)}"}), 500
+
+    def stream():
+        try:
+            for event in run_parameter_sweep(signals_df, config, grid, rank_by):
+                yield json.dumps(event) + "\n"
+        except Exception as e:
+            traceback.print_exc()
+            yield json.dumps({"type": "error", "error": str(e)}) + "\n"
+    return Response(stream_with_context(stream()), mimetype='application/x-ndjson')
+
 @app.route('/api/get-latest-signal', methods=['GET'])
 def get_latest_signal():
     provided_key = request.headers.get('X-API-KEY')
@@ -337,41 +673,50 @@ def get_latest_signal():
     if not provided_key or provided_key != correct_key:
         return jsonify({"error": "Unauthorized"}), 401
 
-    conn = get_db_connection()
-    if not conn: return jsonify({"error": "Database connection failed"}), 500
-    
     signal = None
     try:
-        cur = conn.cursor()
-        # --- THIS IS THE CRITICAL FIX ---
-        # Get the single most recent 'active' trade, regardless of when it was opened.
-        # The bot will be responsible for checking if it's new.
-        cur.execute("""
-            SELECT id, symbol, strategy, timeframe, trade_type, entry_price, stop_loss, take_profit, entry_date
-            FROM live_signals 
-            WHERE status = 'active'
-            ORDER BY entry_date DESC 
-            LIMIT 1;
-        """)
-        # ---------------------------------
-        trade_data = cur.fetchone()
-        if trade_data:
-            columns = [desc[0] for desc in cur.description]
-            signal = dict(zip(columns, trade_data))
-            if signal and 'entry_date' in signal:
-                signal['entry_date'] = signal['entry_date'].isoformat()
+        with DB_POOL.cursor() as cur:
+            # --- THIS IS THE CRITICAL FIX ---
+            # Get the single most recent 'active' trade, regardless of when it was opened.
+            # The bot will be responsible for checking if it's new.
+            cur.execute("""
+                SELECT id, symbol, strategy, timeframe, trade_type, entry_price, stop_loss, take_profit, entry_date
+                FROM live_signals 
+                WHERE status = 'active'
+                ORDER BY entry_date DESC 
+                LIMIT 1;
+            """)
+            # ---------------------------------
+            trade_data = cur.fetchone()
+            if trade_data:
+                columns = [desc[0] for desc in cur.description]
+                signal = dict(zip(columns, trade_data))
+                if signal and 'entry_date' in signal:
+                    signal['entry_date'] = signal['entry_date'].isoformat()
     except Exception as e:
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
-    finally:
-        if conn: cur.close(); conn.close()
         
     return jsonify(signal)
 
 # --- SCHEDULER & MAIN BLOCK ---
 scheduler = BackgroundScheduler()
-scheduler.add_job(func=check_all_signals, trigger="interval", seconds=60)
-scheduler.start()
+# Ticks are cheap when no bar has closed. One cycle at a time: a run that overlaps the next tick makes
+# APScheduler skip that tick, and ticks missed while the process was busy are coalesced into one run
+scheduler.add_job(func=check_all_signals, trigger="interval", seconds=SCHEDULER_TICK_SECONDS, max_instances=1, coalesce=True, misfire_grace_time=SCHEDULER_TICK_SECONDS)
+# The backend owns the live_signals schema; a database that's down at boot only costs this attempt
+if MIGRATE_ON_START and DATABASE_URL and multiprocessing.parent_process() is None:
+    try:
+        migrate(DB_POOL)
+    except Exception as e:
+        print(f"--- Schema migration failed: {e} ---")
+        traceback.print_exc()
+# Sweep pool workers are spawned and may re-import this module; only the real server runs the worker.
+# RUN_SCHEDULER=0 imports the app without it, e.g. for bench.py
+if RUN_SCHEDULER and multiprocessing.parent_process() is None:
+    scheduler.start()
+    # Picks up messages spooled before the last restart without waiting for a new notification
+    if DISCORD_DISPATCHER is not None: DISCORD_DISPATCHER.start()
 @app.route('/')
 def index(): return "<h1>24/7 Watchlist Worker is Running</h1>"
 if __name__ == '__main__':
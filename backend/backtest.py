@@ -0,0 +1,322 @@
+#
+# Backtesting engines used by /api/backtest.
+#
+
+import bisect
+import heapq
+import itertools
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+from metrics import timed
+
+
+def summarize_backtest(trades, capital, initial_capital, max_drawdown, equity_curve):
+    if not trades: return {"trades": [], "performance": {"totalReturn": 0, "winRate": 0, "profitFactor": 0, "totalTrades": 0, "avgWin": 0, "avgLoss": 0, "maxDrawdown": 0, "finalCapital": initial_capital}, "equityCurve": equity_curve, "error": "No trades were executed."}
+    total_return = ((capital - initial_capital) / initial_capital) * 100
+    wins = [t for t in trades if t['pnl'] > 0]; losses = [t for t in trades if t['pnl'] <= 0]
+    win_rate = (len(wins) / len(trades)) * 100 if trades else 0; total_profit = sum(t['pnl'] for t in wins); total_loss = abs(sum(t['pnl'] for t in losses))
+    profit_factor = total_profit / total_loss if total_loss > 0 else 999
+    return {"trades": trades, "performance": {"totalReturn": round(total_return, 2), "winRate": round(win_rate, 2), "profitFactor": round(profit_factor, 2), "totalTrades": len(trades), "avgWin": round(total_profit/len(wins) if wins else 0, 2), "avgLoss": round(total_loss/len(losses) if losses else 0, 2), "maxDrawdown": round(max_drawdown*100, 2), "finalCapital": round(capital, 2)}, "equityCurve": equity_curve}
+
+# --- ADVANCED BACKTESTING ENGINE (WITH CORRECTED LOWERCASE COLUMN NAMES) ---
+@timed('backtest.loop')
+def run_backtest_simulation(df, initial_capital, risk_per_trade, max_trades_per_day, atr_multiplier, target_multiplier, slippage_pips, commission_per_trade):
+    trades, capital, peak_capital, max_drawdown, position, daily_trade_count, slippage, warmup_period = [], initial_capital, initial_capital, 0.0, None, {}, slippage_pips * 0.0001, 50
+    equity_curve = []
+    for i in range(warmup_period, len(df)):
+        current, prev = df.iloc[i], df.iloc[i-1]
+        current_date = current['time'].date()
+        if current_date not in daily_trade_count: daily_trade_count[current_date] = 0
+        equity_curve.append({'time': current['time'], 'capital': capital})
+        if position:
+            exit_reason, exit_price = None, 0.0
+            if position['type'] == 'LONG':
+                if current['low'] <= position['stop_loss']: exit_reason, exit_price = "Stop Loss", position['stop_loss']
+                elif current['high'] >= position['take_profit']: exit_reason, exit_price = "Take Profit", position['take_profit']
+            elif position['type'] == 'SHORT':
+                if current['high'] >= position['stop_loss']: exit_reason, exit_price = "Stop Loss", position['stop_loss']
+                elif current['low'] <= position['take_profit']: exit_reason, exit_price = "Take Profit", position['take_profit']
+            if i == len(df) - 1 and not exit_reason: exit_reason, exit_price = "End of Period", current['close']
+            if exit_reason:
+                exit_price += (slippage if position['type'] == 'SHORT' else -slippage)
+                pnl = (exit_price - position['entry_price']) * position['position_size'] if position['type'] == 'LONG' else (position['entry_price'] - exit_price) * position['position_size']
+                pnl -= commission_per_trade; capital += pnl; peak_capital = max(peak_capital, capital)
+                drawdown = (peak_capital - capital) / peak_capital if peak_capital > 0 else 0
+                max_drawdown = max(max_drawdown, drawdown)
+                position.update({'exit_price': exit_price, 'pnl': pnl, 'exit_reason': exit_reason}); trades.append(position); position = None
+        if not position and prev['signal'] == 'STAY_OUT' and current['signal'] != 'STAY_OUT':
+            if daily_trade_count[current_date] >= max_trades_per_day: continue
+            atr_approx = (current['high'] - current['low']) * 0.7
+            if pd.isna(atr_approx) or atr_approx == 0: continue
+            entry_price = current['open'] + (slippage if current['signal'] == 'LONG' else -slippage)
+            if current['signal'] == 'LONG':
+                stop_loss = entry_price - (atr_approx * atr_multiplier)
+                take_profit = entry_price + (atr_approx * target_multiplier)
+            else:
+                stop_loss = entry_price + (atr_approx * atr_multiplier)
+                take_profit = entry_price - (atr_approx * target_multiplier)
+            risk_amount = capital * (risk_per_trade / 100); price_diff = abs(entry_price - stop_loss)
+            position_size = risk_amount / price_diff if price_diff > 0 else 0
+            if position_size > 0:
+                daily_trade_count[current_date] += 1
+                position = {'entry_date': current['time'], 'type': current['signal'], 'entry_price': entry_price, 'stop_loss': stop_loss, 'take_profit': take_profit, 'position_size': position_size}
+    return summarize_backtest(trades, capital, initial_capital, max_drawdown, equity_curve)
+
+# --- ARRAY BACKTESTING ENGINE ---
+# Same rules as run_backtest_simulation, but everything that doesn't depend on the running
+# position (entry candidates, entry/stop/target levels, trading days) is worked out up front
+# with NumPy, and the stateful walk runs over plain lists. While flat it jumps straight to the
+# next entry candidate. The arithmetic is done in the same order as the per-bar loop, so
+# trades, performance and the equity curve come out identical.
+def _entry_levels(df, atr_multiplier, target_multiplier, slippage):
+    """Entry candidates and their entry/stop/target levels for every bar of a signals frame."""
+    signal = df['signal'].to_numpy(dtype=object)
+    open_, high, low = (df[col].to_numpy(dtype=float) for col in ('open', 'high', 'low'))
+    is_long = signal == 'LONG'
+    is_candidate = np.zeros(len(df), dtype=bool)
+    is_candidate[1:] = (signal[:-1] == 'STAY_OUT') & (signal[1:] != 'STAY_OUT')
+    atr_approx = (high - low) * 0.7
+    with np.errstate(invalid='ignore'):
+        is_candidate &= ~np.isnan(atr_approx) & (atr_approx != 0)
+    entry_price = open_ + np.where(is_long, slippage, -slippage)
+    stop_loss = np.where(is_long, entry_price - (atr_approx * atr_multiplier), entry_price + (atr_approx * atr_multiplier))
+    take_profit = np.where(is_long, entry_price + (atr_approx * target_multiplier), entry_price - (atr_approx * target_multiplier))
+    return signal, high, low, is_candidate, entry_price, stop_loss, take_profit
+
+
+def prepare_backtest_arrays(df, atr_multiplier, target_multiplier, slippage_pips):
+    """Precomputes the per-bar inputs of run_backtest_arrays for one signals frame."""
+    slippage = slippage_pips * 0.0001
+    signal, high, low, is_candidate, entry_price, stop_loss, take_profit = _entry_levels(df, atr_multiplier, target_multiplier, slippage)
+    return {
+        'time': df['time'].tolist(), 'day': df['time'].dt.date.tolist(), 'signal': signal.tolist(),
+        'high': high.tolist(), 'low': low.tolist(), 'close': df['close'].to_numpy(dtype=float).tolist(),
+        'candidates': np.flatnonzero(is_candidate).tolist(),
+        'entry_price': entry_price.tolist(), 'stop_loss': stop_loss.tolist(), 'take_profit': take_profit.tolist(),
+        'slippage': slippage,
+    }
+
+
+@timed('backtest.array')
+def run_backtest_arrays(df, initial_capital, risk_per_trade, max_trades_per_day, atr_multiplier, target_multiplier, slippage_pips, commission_per_trade, arrays=None):
+    a = arrays or prepare_backtest_arrays(df, atr_multiplier, target_multiplier, slippage_pips)
+    time, day, signal, high, low, close = a['time'], a['day'], a['signal'], a['high'], a['low'], a['close']
+    candidates, slippage, n, warmup_period = a['candidates'], a['slippage'], len(a['time']), 50
+    trades, capital, peak_capital, max_drawdown, position, daily_trade_count, equity = [], initial_capital, initial_capital, 0.0, None, {}, []
+    next_candidate = bisect.bisect_left(candidates, warmup_period)
+    i = warmup_period
+    while i < n:
+        if not position:
+            # Nothing can happen until the next entry candidate, so capital is flat until then
+            if next_candidate >= len(candidates):
+                equity.extend([capital] * (n - i)); break
+            j = candidates[next_candidate]
+            equity.extend([capital] * (j - i)); i = j
+        equity.append(capital)
+        if position:
+            exit_reason, exit_price = None, 0.0
+            if position['type'] == 'LONG':
+                if low[i] <= position['stop_loss']: exit_reason, exit_price = "Stop Loss", position['stop_loss']
+                elif high[i] >= position['take_profit']: exit_reason, exit_price = "Take Profit", position['take_profit']
+            else:
+                if high[i] >= position['stop_loss']: exit_reason, exit_price = "Stop Loss", position['stop_loss']
+                elif low[i] <= position['take_profit']: exit_reason, exit_price = "Take Profit", position['take_profit']
+            if i == n - 1 and not exit_reason: exit_reason, exit_price = "End of Period", close[i]
+            if exit_reason:
+                exit_price += (slippage if position['type'] == 'SHORT' else -slippage)
+                pnl = (exit_price - position['entry_price']) * position['position_size'] if position['type'] == 'LONG' else (position['entry_price'] - exit_price) * position['position_size']
+                pnl -= commission_per_trade; capital += pnl; peak_capital = max(peak_capital, capital)
+                drawdown = (peak_capital - capital) / peak_capital if peak_capital > 0 else 0
+                max_drawdown = max(max_drawdown, drawdown)
+                position.update({'exit_price': exit_price, 'pnl': pnl, 'exit_reason': exit_reason}); trades.append(position); position = None
+        while next_candidate < len(candidates) and candidates[next_candidate] < i: next_candidate += 1
+        if not position and next_candidate < len(candidates) and candidates[next_candidate] == i:
+            next_candidate += 1
+            if daily_trade_count.get(day[i], 0) < max_trades_per_day:
+                entry_price, stop_loss = a['entry_price'][i], a['stop_loss'][i]
+                risk_amount = capital * (risk_per_trade / 100); price_diff = abs(entry_price - stop_loss)
+                position_size = risk_amount / price_diff if price_diff > 0 else 0
+                if position_size > 0:
+                    daily_trade_count[day[i]] = daily_trade_count.get(day[i], 0) + 1
+                    position = {'entry_date': time[i], 'type': signal[i], 'entry_price': entry_price, 'stop_loss': stop_loss, 'take_profit': a['take_profit'][i], 'position_size': position_size}
+        i += 1
+    equity_curve = [{'time': t, 'capital': c} for t, c in zip(time[warmup_period:], equity)]
+    return summarize_backtest(trades, capital, initial_capital, max_drawdown, equity_curve)
+
+
+BACKTEST_ENGINES = {'loop': run_backtest_simulation, 'array': run_backtest_arrays}
+
+
+# --- PORTFOLIO ENGINE ---
+# Many (symbol, strategy, timeframe) signal frames traded against one capital pool. Each frame is
+# cut down to a few NumPy arrays as soon as its signals exist, and the walk pulls bars from all of
+# them in time order through heapq.merge, so the merged timeline is never built in memory.
+# Each instrument follows run_backtest_arrays' entry, exit and sizing rules and holds at most one
+# position; sizing and drawdown use the shared capital and `max_open_positions` caps them all.
+def compact_portfolio_arrays(df, atr_multiplier, target_multiplier, slippage_pips):
+    """The per-bar inputs of run_portfolio_backtest for one signals frame."""
+    slippage = slippage_pips * 0.0001
+    signal, high, low, is_candidate, entry_price, stop_loss, take_profit = _entry_levels(df, atr_multiplier, target_multiplier, slippage)
+    times = pd.DatetimeIndex(df['time'])
+    local = times.tz_localize(None) if times.tz is not None else times
+    return {
+        'time': times.as_unit('ns').asi8.copy(), 'day': local.to_numpy().astype('datetime64[D]').astype(np.int64),
+        'is_long': signal == 'LONG', 'high': high, 'low': low, 'close': df['close'].to_numpy(dtype=float),
+        'candidate': is_candidate, 'entry_price': entry_price, 'stop_loss': stop_loss, 'take_profit': take_profit,
+        'slippage': slippage,
+    }
+
+
+def _portfolio_bars(k, arrays, warmup_period):
+    for i, t in enumerate(arrays['time'][warmup_period:].tolist(), warmup_period):
+        yield t, k, i
+
+
+@timed('backtest.portfolio')
+def run_portfolio_backtest(instruments, initial_capital, risk_per_trade, max_trades_per_day, commission_per_trade, max_open_positions):
+    """
+    `instruments` is a list of (label, arrays) pairs: a dict such as {symbol, strategy, timeframe}
+    that is copied onto each of its trades, and the output of compact_portfolio_arrays.
+    Trade and equity times are in UTC, since the instruments' own timezones can differ.
+    Bars sharing a timestamp settle all their exits before any new entries are considered.
+    """
+    warmup_period = 50
+    streams = [_portfolio_bars(k, arrays, warmup_period) for k, (_, arrays) in enumerate(instruments)]
+    trades, capital, peak_capital, max_drawdown, positions, daily_trade_count = [], initial_capital, initial_capital, 0.0, {}, {}
+    equity_times, equity = [], []
+    for t, bars in itertools.groupby(heapq.merge(*streams), key=lambda bar: bar[0]):
+        bars = list(bars)
+        equity_times.append(t); equity.append(capital)
+        for _, k, i in bars:
+            position = positions.get(k)
+            if position is None: continue
+            a = instruments[k][1]
+            exit_reason, exit_price = None, 0.0
+            if position['type'] == 'LONG':
+                if a['low'][i] <= position['stop_loss']: exit_reason, exit_price = "Stop Loss", position['stop_loss']
+                elif a['high'][i] >= position['take_profit']: exit_reason, exit_price = "Take Profit", position['take_profit']
+            else:
+                if a['high'][i] >= position['stop_loss']: exit_reason, exit_price = "Stop Loss", position['stop_loss']
+                elif a['low'][i] <= position['take_profit']: exit_reason, exit_price = "Take Profit", position['take_profit']
+            if i == len(a['time']) - 1 and not exit_reason: exit_reason, exit_price = "End of Period", float(a['close'][i])
+            if exit_reason:
+                exit_price += (a['slippage'] if position['type'] == 'SHORT' else -a['slippage'])
+                pnl = (exit_price - position['entry_price']) * position['position_size'] if position['type'] == 'LONG' else (position['entry_price'] - exit_price) * position['position_size']
+                pnl -= commission_per_trade; capital += pnl; peak_capital = max(peak_capital, capital)
+                drawdown = (peak_capital - capital) / peak_capital if peak_capital > 0 else 0
+                max_drawdown = max(max_drawdown, drawdown)
+                position.update({'exit_price': exit_price, 'pnl': pnl, 'exit_reason': exit_reason}); trades.append(position); del positions[k]
+        for _, k, i in bars:
+            a = instruments[k][1]
+            if k in positions or not a['candidate'][i] or len(positions) >= max_open_positions: continue
+            day = (k, int(a['day'][i]))
+            if daily_trade_count.get(day, 0) >= max_trades_per_day: continue
+            entry_price, stop_loss = float(a['entry_price'][i]), float(a['stop_loss'][i])
+            risk_amount = capital * (risk_per_trade / 100); price_diff = abs(entry_price - stop_loss)
+            position_size = risk_amount / price_diff if price_diff > 0 else 0
+            if position_size > 0:
+                daily_trade_count[day] = daily_trade_count.get(day, 0) + 1
+                positions[k] = {**instruments[k][0], 'entry_date': pd.Timestamp(t, tz='UTC'), 'type': 'LONG' if a['is_long'][i] else 'SHORT', 'entry_price': entry_price, 'stop_loss': stop_loss, 'take_profit': float(a['take_profit'][i]), 'position_size': position_size}
+    equity_curve = [{'time': time, 'capital': c} for time, c in zip(pd.DatetimeIndex(np.asarray(equity_times, dtype='datetime64[ns]'), tz='UTC'), equity)]
+    result = summarize_backtest(trades, capital, initial_capital, max_drawdown, equity_curve)
+    result['instruments'] = summarize_instruments(instruments, trades)
+    return result
+
+
+def summarize_instruments(instruments, trades):
+    """Per-instrument trade count, win rate and net PnL for a portfolio run."""
+    summary = []
+    for label, _ in instruments:
+        own = [t for t in trades if all(t.get(key) == value for key, value in label.items())]
+        wins = sum(1 for t in own if t['pnl'] > 0)
+        summary.append({**label, 'totalTrades': len(own), 'winRate': round(wins / len(own) * 100, 2) if own else 0, 'netPnl': round(sum(t['pnl'] for t in own), 2)})
+    return summary
+
+
+# --- PARAMETER SWEEP ---
+# Swept keys use the same names as the /api/backtest request body.
+SWEEP_PARAMETERS = {'atrMultiplier': float, 'targetMultiplier': float, 'riskPerTrade': float, 'maxTradesPerDay': int}
+SWEEP_DEFAULTS = {'initialCapital': 10000, 'riskPerTrade': 2.0, 'maxTradesPerDay': 5, 'atrMultiplier': 1.0, 'targetMultiplier': 2.5, 'slippage': 1.5, 'commission': 4.0}
+RANK_ASCENDING = {'maxDrawdown', 'avgLoss'}
+SWEEP_WORKERS = os.cpu_count() or 1
+_SWEEP_POOL = None
+
+
+def _sweep_values(spec, cast, max_values):
+    """
+    A sweep axis is either an explicit list of values or {start, stop, step} with an inclusive stop.
+    Raises ValueError before building a range of more than `max_values` values.
+    """
+    if isinstance(spec, dict):
+        start, stop, step = float(spec['start']), float(spec['stop']), float(spec['step'])
+        if not all(math.isfinite(v) for v in (start, stop, step)): raise ValueError("start, stop and step must be finite")
+        if step <= 0: raise ValueError("step must be positive")
+        count = int(math.floor((stop - start) / step + 1e-9)) + 1
+        if count > max_values: raise ValueError(f"Sweep range has {count} values; the limit is {max_values}.")
+        values = [round(start + k * step, 10) for k in range(max(count, 0))]
+    else:
+        values = list(spec) if isinstance(spec, (list, tuple)) else [spec]
+    return sorted({cast(v) for v in values})
+
+
+def expand_sweep_grid(config, max_runs):
+    """Cartesian product of the config's `sweep` axes over its base parameters. Raises ValueError past max_runs."""
+    base = {key: cast(config.get(key, SWEEP_DEFAULTS[key])) for key, cast in SWEEP_PARAMETERS.items()}
+    sweep = config.get('sweep') or {}
+    if not isinstance(sweep, dict): raise ValueError("'sweep' must be an object of parameter ranges.")
+    axes, total = {}, 1
+    for key, spec in sweep.items():
+        if key not in SWEEP_PARAMETERS: raise ValueError(f"Cannot sweep '{key}'. Sweepable: {', '.join(SWEEP_PARAMETERS)}.")
+        # No axis may be longer than the runs the other axes leave room for
+        axes[key] = _sweep_values(spec, SWEEP_PARAMETERS[key], max_runs // total)
+        if not axes[key]: raise ValueError(f"Sweep range for '{key}' is empty.")
+        total *= len(axes[key])
+        if total > max_runs: raise ValueError(f"Sweep has more than {max_runs} runs; the limit is {max_runs}.")
+    grid = [dict(base)]
+    for key, values in axes.items():
+        grid = [{**params, key: value} for params in grid for value in values]
+    return grid
+
+
+def _run_sweep_chunk(frame, fixed, chunk):
+    """Runs one batch of parameter sets in a pool worker. Arrays are shared between runs with the same stop/target multipliers."""
+    arrays, results = {}, []
+    for params in chunk:
+        levels = (params['atrMultiplier'], params['targetMultiplier'])
+        if levels not in arrays: arrays[levels] = prepare_backtest_arrays(frame, levels[0], levels[1], fixed['slippage'])
+        result = run_backtest_arrays(frame, fixed['initialCapital'], params['riskPerTrade'], params['maxTradesPerDay'], params['atrMultiplier'], params['targetMultiplier'], fixed['slippage'], fixed['commission'], arrays=arrays[levels])
+        results.append({'params': params, 'performance': result['performance']})
+    return results
+
+
+def get_sweep_pool():
+    # Spawned rather than forked: the web process has scheduler and request threads running.
+    global _SWEEP_POOL
+    if _SWEEP_POOL is None:
+        _SWEEP_POOL = ProcessPoolExecutor(max_workers=SWEEP_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+    return _SWEEP_POOL
+
+
+def run_parameter_sweep(signals_df, config, grid, rank_by='totalReturn'):
+    """
+    Runs every parameter set in `grid` against one signals frame on the shared process pool.
+    Yields progress dicts as chunks finish, then a final dict with the runs ranked by `rank_by`.
+    """
+    frame = signals_df[['time', 'open', 'high', 'low', 'close', 'signal']]
+    fixed = {key: float(config.get(key, SWEEP_DEFAULTS[key])) for key in ('initialCapital', 'slippage', 'commission')}
+    pool = get_sweep_pool()
+    chunk_size = max(1, len(grid) // (SWEEP_WORKERS * 4))
+    futures = [pool.submit(_run_sweep_chunk, frame, fixed, grid[i:i + chunk_size]) for i in range(0, len(grid), chunk_size)]
+    results = []
+    try:
+        for future in as_completed(futures):
+            results.extend(future.result())
+            yield {'type': 'progress', 'completed': len(results), 'total': len(grid)}
+    finally:
+        for future in futures: future.cancel()
+    results.sort(key=lambda r: r['performance'][rank_by], reverse=rank_by not in RANK_ASCENDING)
+    yield {'type': 'result', 'rankBy': rank_by, 'total': len(results), 'results': [{**r['params'], **r['performance']} for r in results]}
@@ -0,0 +1,101 @@
+#
+# Bar-close awareness for the watchlist worker: which (symbol, timeframe) series have a newly
+# closed bar worth evaluating, given each asset class's trading hours.
+#
+
+import threading
+import pandas as pd
+from bars import bar_ends, bar_starts
+
+# Yahoo aligns forex bars to London midnight and crypto bars to UTC midnight
+SESSION_TZ = {'forex': 'Europe/London', 'crypto': 'UTC', 'other': 'UTC'}
+# The forex week runs from Sunday 17:00 to Friday 17:00 New York time
+FOREX_WEEK_TZ = 'America/New_York'
+
+
+def asset_class(symbol):
+    if symbol.endswith('=X'): return 'forex'
+    if symbol.endswith(('-USD', '-USDT', '-EUR')): return 'crypto'
+    return 'other'
+
+
+def market_open(symbol, ts):
+    """Whether the symbol trades at `ts`. Crypto is 24/7; anything unrecognised is treated as always open."""
+    if asset_class(symbol) != 'forex': return True
+    local = ts.tz_convert(FOREX_WEEK_TZ)
+    if local.dayofweek == 5: return False
+    if local.dayofweek == 4 and local.hour >= 17: return False
+    if local.dayofweek == 6 and local.hour < 17: return False
+    return True
+
+
+def session_times(symbol, times):
+    """
+    `times` in the symbol's session timezone. Naive times (Yahoo's daily dates) are taken as already
+    being session-local wall clock.
+    """
+    tz = SESSION_TZ[asset_class(symbol)]
+    if times.dt.tz is not None: return times.dt.tz_convert(tz)
+    return times.dt.tz_localize(tz, ambiguous=True, nonexistent='shift_forward')
+
+
+def bar_end_times(times, interval):
+    """When each bar starting at `times` closes, on the same alignment resample_ohlcv builds bars with."""
+    # A calendar day, so daily bars close on local midnight on DST days too
+    if interval == '1d': return times + pd.DateOffset(days=1)
+    return bar_ends(times, interval)
+
+
+def last_bar_end(symbol, interval, ts):
+    """The most recent bar boundary at or before `ts`, aligned by bar_starts in the symbol's session timezone."""
+    local = ts.tz_convert(SESSION_TZ[asset_class(symbol)])
+    if interval == '1d': return local.normalize()
+    return bar_starts(pd.Series([local]), interval).iloc[0]
+
+
+class BarCloseSchedule:
+    """
+    Remembers the last closed bar evaluated per (symbol, timeframe) and answers which series have
+    closed a bar since then, `grace` seconds after the boundary so the provider has published it.
+    A series only counts as due if the market was open during the bar, so forex stays idle over
+    the weekend while crypto keeps going. Open trades are rechecked every `exit_check` seconds.
+    """
+
+    def __init__(self, grace=20, exit_check=60):
+        self.grace, self.exit_check = pd.Timedelta(seconds=grace), pd.Timedelta(seconds=exit_check)
+        self._evaluated = {}
+        self._exit_checked = {}
+        self._lock = threading.Lock()
+
+    def is_due(self, key, now):
+        symbol, interval = key
+        boundary = last_bar_end(symbol, interval, now - self.grace)
+        with self._lock:
+            evaluated = self._evaluated.get(key)
+        if evaluated is None: return True
+        if boundary <= evaluated: return False
+        # Any trading between the last evaluated bar and the newest boundary means a new bar exists
+        return market_open(symbol, evaluated) or market_open(symbol, boundary - pd.Timedelta(seconds=1))
+
+    def exit_check_due(self, key, now):
+        with self._lock:
+            checked = self._exit_checked.get(key)
+        return checked is None or now - checked >= self.exit_check
+
+    def is_new_bar(self, key, bar_end):
+        with self._lock:
+            evaluated = self._evaluated.get(key)
+        return evaluated is None or bar_end > evaluated
+
+    def mark_evaluated(self, key, bar_end):
+        with self._lock:
+            self._evaluated[key] = max(bar_end, self._evaluated.get(key, bar_end))
+
+    def mark_exit_checked(self, key, now):
+        with self._lock:
+            self._exit_checked[key] = now
+
+    def reset(self, key=None):
+        with self._lock:
+            if key is None: self._evaluated.clear(); self._exit_checked.clear()
+            else: self._evaluated.pop(key, None); self._exit_checked.pop(key, None)
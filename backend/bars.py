@@ -0,0 +1,64 @@
+#
+# Bar alignment and local resampling of higher timeframes. Kept free of provider imports so the
+# worker's schedule, the resampler and their tests share one definition of where bars start.
+#
+
+import math
+import numpy as np
+import pandas as pd
+
+# Intraday intervals we can build from a finer series. Daily bars are always downloaded
+# natively because Yahoo's session boundaries for them differ per asset class.
+INTERVAL_MINUTES = {'1m': 1, '2m': 2, '5m': 5, '15m': 15, '30m': 30, '60m': 60, '90m': 90, '1h': 60, '4h': 240}
+OHLCV_AGG = {'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last', 'volume': 'sum', 'dividends': 'sum', 'stock splits': 'sum'}
+
+
+def history_days(interval, bars):
+    """
+    Calendar days of history holding at least `bars` bars of `interval` for a market open five days
+    a week: the trading days scaled to whole weeks, a partial weekend, and a tenth for holidays and gaps.
+    """
+    trading_days = bars * INTERVAL_MINUTES.get(interval, 1440) / 1440
+    return math.ceil((trading_days * 7 / 5 + 2) * 1.1)
+
+
+def bar_starts(times, interval):
+    """
+    Start of the `interval` bar each timestamp falls in: whole bar lengths from that day's midnight
+    in wall-clock time of the times' own timezone, so bars stay on 00:00/04:00/... local time on
+    either side of a DST change. In the hour repeated when clocks go back, each bar keeps the UTC
+    offset of the rows it holds.
+    """
+    length = pd.Timedelta(minutes=INTERVAL_MINUTES[interval])
+    tz = times.dt.tz
+    wall = times.dt.tz_localize(None) if tz is not None else times
+    midnight = wall.dt.normalize()
+    starts = midnight + ((wall - midnight) // length) * length
+    if tz is None: return starts
+    is_dst = wall.dt.tz_localize(tz, ambiguous=np.ones(len(wall), dtype=bool), nonexistent='shift_forward') == times
+    return starts.dt.tz_localize(tz, ambiguous=is_dst.to_numpy(), nonexistent='shift_forward')
+
+
+def bar_ends(starts, interval):
+    """
+    End of each bar beginning at `starts`, i.e. the next bar start. On DST days that is a bar length
+    plus or minus the clock change away.
+    """
+    length = pd.Timedelta(minutes=INTERVAL_MINUTES[interval])
+    ends = bar_starts(starts + length, interval)
+    # Clocks went back inside the bar: one length later is still the same wall-clock bar
+    stuck = ends <= starts
+    if stuck.any(): ends[stuck] = bar_starts(starts[stuck] + length + pd.Timedelta(hours=1), interval)
+    return ends
+
+
+def resample_ohlcv(df, interval):
+    """
+    Builds `interval` bars from a cleaned, finer-grained frame. Bars are left-closed and labelled
+    by bar_starts, which is how Yahoo aligns its intraday bars, and empty buckets (weekends,
+    session breaks) never appear.
+    """
+    agg = {col: how for col, how in OHLCV_AGG.items() if col in df.columns}
+    bars = df.groupby(bar_starts(df['time'], interval).rename('time'), sort=True).agg(agg)
+    bars = bars.dropna(subset=['close'])
+    return bars.reset_index()
@@ -0,0 +1,184 @@
+#
+# Benchmark suite for the signal and backtest pipeline. Runs entirely on synthetic OHLCV (or a
+# recorded CSV fixture), so it needs no network or database:
+#
+#   python bench.py                          # every case, both strategies
+#   python bench.py --cases 5d_5m 1y_1h --stages generate_signals backtest.array
+#   python bench.py --fixture eurusd_1h.csv --json results.json
+#
+# Each stage is timed over --repeat runs (best run reported) and then run once more under
+# tracemalloc for its peak memory. Bars/s is bars in the input frame per second of the best run.
+#
+
+import argparse
+import itertools
+import json
+import os
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+# Import the app without starting the watchlist scheduler or touching the database
+os.environ.setdefault('RUN_SCHEDULER', '0')
+os.environ.setdefault('MIGRATE_ON_START', '0')
+from app import WATCHLIST, generate_signals, evaluate_series, INDICATORS, BAR_SCHEDULE
+from indicators import WARMUP_BARS
+from market_data import INTERVAL_MINUTES, clean_yfinance_data
+from backtest import run_backtest_arrays, run_backtest_simulation
+
+# name: (bar frequency, number of bars)
+BENCH_CASES = {
+    '5d_5m': ('5min', 5 * 288),
+    '60d_15m': ('15min', 60 * 96),
+    '1y_1h': ('60min', 365 * 24),
+    '3y_1h': ('60min', 3 * 365 * 24),
+}
+STRATEGIES = ('momentum', 'scalping')
+STAGES = ('clean_yfinance_data', 'generate_signals', 'backtest.loop', 'backtest.array', 'worker_cycle')
+BACKTEST_ARGS = (10000.0, 2.0, 5, 1.0, 2.5, 1.5, 4.0)
+
+
+def synthetic_ohlcv(bars, freq, seed=0, start='2022-01-03'):
+    """
+    A raw yfinance-shaped frame (capitalised columns, 'Datetime' index) from a random walk whose
+    drift slowly changes sign, so both strategies see trends as well as chop.
+    """
+    rng = np.random.default_rng(seed)
+    drift = 4e-4 * np.sin(np.linspace(0, 12 * np.pi, bars))
+    close = 1.1 * np.exp(np.cumsum(drift + rng.normal(0, 1.5e-3, bars)))
+    open_ = np.r_[close[0], close[:-1]]
+    high = np.maximum(open_, close) * (1 + rng.uniform(0, 1e-3, bars))
+    low = np.minimum(open_, close) * (1 - rng.uniform(0, 1e-3, bars))
+    index = pd.date_range(start, periods=bars, freq=freq, tz='UTC', name='Datetime')
+    return pd.DataFrame({'Open': open_, 'High': high, 'Low': low, 'Close': close, 'Volume': rng.integers(0, 10000, bars).astype(float), 'Dividends': 0.0, 'Stock Splits': 0.0}, index=index)
+
+
+def load_fixture(path):
+    """A recorded OHLCV CSV in yfinance's layout: a datetime first column, then Open/High/Low/Close/Volume."""
+    df = pd.read_csv(path, index_col=0)
+    df.index = pd.to_datetime(df.index, utc=True)
+    df.index.name = 'Datetime'
+    return df
+
+
+def measure(func, repeat):
+    """Best wall time over `repeat` runs, then one traced run for peak memory. Returns (best_s, peak_bytes)."""
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+
+def worker_cycle_inputs(seed=0, new_bars=0):
+    """
+    The frames the worker would fetch for every (symbol, timeframe) on the watchlist: 5 days of
+    bars, or the indicator warm-up if that is longer. Returns `new_bars` + 1 successive windows,
+    each one bar later than the one before, as the worker sees them from one bar close to the next.
+    """
+    series = {}
+    for config in WATCHLIST:
+        key = (config['symbol'], config['timeframe'])
+        if key in series: continue
+        minutes = INTERVAL_MINUTES.get(config['timeframe'], 1440)
+        bars = max(5 * 1440 // minutes, WARMUP_BARS + 10)
+        series[key] = (bars, clean_yfinance_data(synthetic_ohlcv(bars + new_bars, f"{minutes}min", seed=seed + len(series))))
+    windows = [{key: df.iloc[shift:shift + bars] for key, (bars, df) in series.items()} for shift in range(new_bars + 1)]
+    configs = {}
+    for config in WATCHLIST: configs.setdefault((config['symbol'], config['timeframe']), []).append(config)
+    return windows, configs
+
+
+def run_worker_cycle(series, configs, cold):
+    """
+    One cycle's evaluation of every series with no open trades, each treated as having just closed
+    a bar. Cold rebuilds the indicator state from scratch; warm resumes from the previous cycle's.
+    """
+    if cold: INDICATORS.reset()
+    BAR_SCHEDULE.reset()
+    for key, clean_df in series.items():
+        now = clean_df['time'].iloc[-1] + pd.Timedelta(minutes=INTERVAL_MINUTES.get(key[1], 1440)) * 2
+        evaluate_series(key, configs[key], clean_df, {}, now)
+
+
+def bench_case(name, raw, strategies, stages, repeat):
+    results = []
+    clean = clean_yfinance_data(raw.copy())
+    for strategy in strategies:
+        signals = generate_signals(clean.copy(), strategy)
+        runs = {
+            'clean_yfinance_data': lambda: clean_yfinance_data(raw.copy()),
+            'generate_signals': lambda: generate_signals(clean.copy(), strategy),
+            'backtest.loop': lambda: run_backtest_simulation(signals, *BACKTEST_ARGS),
+            'backtest.array': lambda: run_backtest_arrays(signals, *BACKTEST_ARGS),
+        }
+        for stage in stages:
+            if stage not in runs: continue
+            # Cleaning doesn't depend on the strategy
+            if stage == 'clean_yfinance_data' and strategy != strategies[0]: continue
+            best, peak = measure(runs[stage], repeat)
+            results.append({'case': name, 'strategy': strategy if stage != 'clean_yfinance_data' else '-', 'stage': stage, 'bars': len(raw),
+                            'best_ms': round(best * 1000, 3), 'bars_per_s': round(len(raw) / best) if best else None, 'peak_mb': round(peak / 1e6, 2)})
+    return results
+
+
+def bench_worker_cycle(repeat):
+    # measure() runs the cycle repeat + 1 times, each warm run on the next window
+    windows, configs = worker_cycle_inputs(new_bars=repeat + 1)
+    bars = sum(len(df) for df in windows[0].values())
+    results = []
+    for label, cold in (('cold', True), ('warm', False)):
+        run_worker_cycle(windows[0], configs, cold=True)
+        if cold:
+            cycle = lambda: run_worker_cycle(windows[0], configs, cold=True)
+        else:
+            # Every warm run commits exactly one newly closed bar per series: the incremental update path
+            later = itertools.count(1)
+            cycle = lambda: run_worker_cycle(windows[next(later)], configs, cold=False)
+        best, peak = measure(cycle, repeat)
+        results.append({'case': f'watchlist_{label}', 'strategy': 'both', 'stage': 'worker_cycle', 'bars': bars,
+                        'best_ms': round(best * 1000, 3), 'bars_per_s': round(bars / best) if best else None, 'peak_mb': round(peak / 1e6, 2)})
+    return results
+
+
+def print_table(results):
+    header = f"{'stage':<20} {'case':<16} {'strategy':<9} {'bars':>7} {'best ms':>10} {'bars/s':>11} {'peak MB':>8}"
+    print(header); print('-' * len(header))
+    for r in results:
+        print(f"{r['stage']:<20} {r['case']:<16} {r['strategy']:<9} {r['bars']:>7} {r['best_ms']:>10.2f} {r['bars_per_s'] or 0:>11,} {r['peak_mb']:>8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the signal and backtest pipeline on offline OHLCV.")
+    parser.add_argument('--cases', nargs='+', choices=list(BENCH_CASES), default=list(BENCH_CASES))
+    parser.add_argument('--strategies', nargs='+', choices=STRATEGIES, default=list(STRATEGIES))
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=list(STAGES))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--fixture', action='append', default=[], help="Recorded OHLCV CSV to benchmark as an extra case (repeatable)")
+    parser.add_argument('--json', help="Also write the results to this file")
+    args = parser.parse_args()
+
+    results = []
+    for name in args.cases:
+        freq, bars = BENCH_CASES[name]
+        results.extend(bench_case(name, synthetic_ohlcv(bars, freq, args.seed), args.strategies, args.stages, args.repeat))
+    for path in args.fixture:
+        results.extend(bench_case(os.path.basename(path), load_fixture(path), args.strategies, args.stages, args.repeat))
+    if 'worker_cycle' in args.stages:
+        results.extend(bench_worker_cycle(args.repeat))
+    print_table(results)
+    if args.json:
+        with open(args.json, 'w') as f: json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+#
+# Shared PostgreSQL connection pool for the watchlist worker and the Flask routes.
+#
+
+import threading
+import time
+from contextlib import contextmanager
+import psycopg2
+from psycopg2 import pool as pg_pool
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool on top of psycopg2's ThreadedConnectionPool. psycopg2 raises as soon as the
+    pool is exhausted, so checkouts here wait on a semaphore (up to `timeout` seconds) instead.
+    The underlying pool is created on first use so importing the app never needs the database.
+    """
+
+    def __init__(self, dsn, minconn=1, maxconn=10, timeout=10.0):
+        self.dsn, self.minconn, self.maxconn, self.timeout = dsn, minconn, maxconn, timeout
+        self._pool = None
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self.stats = {'checkouts': 0, 'in_use': 0, 'timeouts': 0, 'errors': 0, 'discarded': 0, 'wait_total_ms': 0.0, 'wait_max_ms': 0.0}
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = pg_pool.ThreadedConnectionPool(self.minconn, self.maxconn, self.dsn)
+            return self._pool
+
+    @contextmanager
+    def connection(self):
+        """
+        Yields a pooled connection and returns it afterwards. The transaction is committed if the
+        block succeeds and rolled back if it raises; connections that broke are discarded.
+        """
+        started = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock: self.stats['timeouts'] += 1
+            raise pg_pool.PoolError(f"No database connection available within {self.timeout}s")
+        conn, broken = None, False
+        try:
+            conn = self._get_pool().getconn()
+            waited_ms = (time.perf_counter() - started) * 1000
+            with self._lock:
+                self.stats['checkouts'] += 1; self.stats['in_use'] += 1
+                self.stats['wait_total_ms'] += waited_ms; self.stats['wait_max_ms'] = max(self.stats['wait_max_ms'], waited_ms)
+            try:
+                yield conn
+                conn.commit()
+            except Exception as e:
+                broken = isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError)) or conn.closed
+                with self._lock: self.stats['errors'] += 1
+                if not conn.closed: conn.rollback()
+                raise
+            finally:
+                with self._lock: self.stats['in_use'] -= 1
+        finally:
+            if conn is not None:
+                if broken:
+                    with self._lock: self.stats['discarded'] += 1
+                self._get_pool().putconn(conn, close=broken or bool(conn.closed))
+            self._slots.release()
+
+    @contextmanager
+    def cursor(self):
+        with self.connection() as conn:
+            cur = conn.cursor()
+            try:
+                yield cur
+            finally:
+                cur.close()
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats['min_size'], stats['max_size'] = self.minconn, self.maxconn
+        stats['wait_avg_ms'] = round(stats['wait_total_ms'] / stats['checkouts'], 3) if stats['checkouts'] else 0.0
+        stats['open_connections'] = (len(self._pool._pool) + len(self._pool._used)) if self._pool else 0
+        return stats
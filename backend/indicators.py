@@ -0,0 +1,231 @@
+#
+# Incremental indicator engine for the watchlist worker.
+# Keeps running EMA / RSI / Bollinger / MACD state per (symbol, timeframe) so each cycle only
+# folds in the bars that arrived since the last one, instead of re-running pandas_ta over the
+# whole history. The formulas mirror pandas_ta's defaults, so the output columns are the same
+# ones generate_signals produces.
+#
+
+import math
+import threading
+from collections import deque
+import pandas as pd
+
+# Longest lookback (ema_50) plus enough bars for the seeds of the EMA and RSI smoothing to decay,
+# after which values no longer depend on where the history started
+WARMUP_BARS = 150
+
+
+class _EMA:
+    """pandas_ta ema(): seeded with the SMA of the first `length` values, then alpha = 2 / (length + 1)."""
+    __slots__ = ('length', 'alpha', 'count', 'total', 'value')
+
+    def __init__(self, length):
+        self.length, self.alpha = length, 2.0 / (length + 1)
+        self.count, self.total, self.value = 0, 0.0, None
+
+    def update(self, x):
+        self.count += 1
+        if self.count < self.length:
+            self.total += x
+        elif self.count == self.length:
+            self.value = (self.total + x) / self.length
+        else:
+            self.value = ((1 - self.alpha) * self.value + self.alpha * x)
+        return self.value
+
+    def copy(self):
+        other = _EMA.__new__(_EMA)
+        other.length, other.alpha, other.count, other.total, other.value = self.length, self.alpha, self.count, self.total, self.value
+        return other
+
+
+class _RMA:
+    """pandas_ta rma(): ewm(alpha=1/length, adjust=True, min_periods=length).mean()."""
+    __slots__ = ('length', 'decay', 'count', 'weight', 'value')
+
+    def __init__(self, length):
+        self.length, self.decay = length, 1.0 - 1.0 / length
+        self.count, self.weight, self.value = 0, 0.0, 0.0
+
+    def update(self, x):
+        self.count += 1
+        if self.count == 1:
+            self.weight, self.value = 1.0, x
+        else:
+            self.weight *= self.decay
+            self.value = (self.weight * self.value + x) / (self.weight + 1.0)
+            self.weight += 1.0
+        return self.value if self.count >= self.length else None
+
+    def copy(self):
+        other = _RMA.__new__(_RMA)
+        other.length, other.decay, other.count, other.weight, other.value = self.length, self.decay, self.count, self.weight, self.value
+        return other
+
+
+class _RSI:
+    """pandas_ta rsi(): Wilder smoothing (rma) of the up and down moves."""
+    __slots__ = ('prev_close', 'gains', 'losses')
+
+    def __init__(self, length):
+        self.prev_close, self.gains, self.losses = None, _RMA(length), _RMA(length)
+
+    def update(self, close):
+        if self.prev_close is None:
+            self.prev_close = close
+            return None
+        change, self.prev_close = close - self.prev_close, close
+        avg_gain, avg_loss = self.gains.update(max(change, 0.0)), self.losses.update(min(change, 0.0))
+        if avg_gain is None or avg_gain + abs(avg_loss) == 0: return None
+        return 100 * avg_gain / (avg_gain + abs(avg_loss))
+
+    def copy(self):
+        other = _RSI.__new__(_RSI)
+        other.prev_close, other.gains, other.losses = self.prev_close, self.gains.copy(), self.losses.copy()
+        return other
+
+
+class _BBands:
+    """pandas_ta bbands(): SMA middle band +/- `std` population standard deviations."""
+    __slots__ = ('length', 'std', 'window')
+
+    def __init__(self, length, std):
+        self.length, self.std, self.window = length, std, deque(maxlen=length)
+
+    def update(self, close):
+        self.window.append(close)
+        if len(self.window) < self.length: return None
+        mid = sum(self.window) / self.length
+        deviation = self.std * math.sqrt(sum((x - mid) ** 2 for x in self.window) / self.length)
+        lower, upper = mid - deviation, mid + deviation
+        band = upper - lower
+        return lower, mid, upper, (100 * band / mid if mid else None), ((close - lower) / band if band else None)
+
+    def copy(self):
+        other = _BBands.__new__(_BBands)
+        other.length, other.std, other.window = self.length, self.std, deque(self.window, maxlen=self.length)
+        return other
+
+
+class _MACD:
+    """pandas_ta macd(): fast EMA - slow EMA, with an EMA signal line started at the first valid MACD value."""
+    __slots__ = ('fast', 'slow', 'signal')
+
+    def __init__(self, fast, slow, signal):
+        self.fast, self.slow, self.signal = _EMA(fast), _EMA(slow), _EMA(signal)
+
+    def update(self, close):
+        fast, slow = self.fast.update(close), self.slow.update(close)
+        if fast is None or slow is None: return None
+        macd = fast - slow
+        signal = self.signal.update(macd)
+        return macd, (macd - signal if signal is not None else None), signal
+
+    def copy(self):
+        other = _MACD.__new__(_MACD)
+        other.fast, other.slow, other.signal = self.fast.copy(), self.slow.copy(), self.signal.copy()
+        return other
+
+
+class IndicatorState:
+    """All indicators generate_signals uses, advanced one close at a time."""
+
+    def __init__(self):
+        self.emas = {length: _EMA(length) for length in (5, 10, 20, 50)}
+        self.rsis = {length: _RSI(length) for length in (7, 14)}
+        self.bbands = _BBands(20, 2.0)
+        self.macds = {'12_26_9': _MACD(12, 26, 9), '5_12_3': _MACD(5, 12, 3)}
+
+    def update(self, close):
+        """Folds in one closing price and returns the indicator columns for that bar."""
+        values = {}
+        for length, ema in self.emas.items(): values[f'ema_{length}'] = ema.update(close)
+        for length, rsi in self.rsis.items(): values[f'rsi_{length}'] = rsi.update(close)
+        bands = self.bbands.update(close) or (None,) * 5
+        for name, value in zip(('bbl', 'bbm', 'bbu', 'bbb', 'bbp'), bands): values[f'{name}_20_2.0'] = value
+        for suffix, macd in self.macds.items():
+            lines = macd.update(close) or (None,) * 3
+            for name, value in zip(('macd', 'macdh', 'macds'), lines): values[f'{name}_{suffix}'] = value
+        return values
+
+    def copy(self):
+        other = IndicatorState.__new__(IndicatorState)
+        other.emas = {k: v.copy() for k, v in self.emas.items()}
+        other.rsis = {k: v.copy() for k, v in self.rsis.items()}
+        other.bbands = self.bbands.copy()
+        other.macds = {k: v.copy() for k, v in self.macds.items()}
+        return other
+
+
+class _SeriesState:
+    __slots__ = ('indicators', 'first_time', 'last_time', 'last_close', 'recent')
+
+    def __init__(self, keep_rows):
+        self.indicators, self.first_time, self.last_time, self.last_close = IndicatorState(), None, None, None
+        self.recent = deque(maxlen=keep_rows)
+
+
+class IncrementalIndicators:
+    """
+    One IndicatorState per (symbol, timeframe). The newest bar of a live frame is still forming,
+    so it is evaluated on a throwaway copy of the state; every earlier bar is committed once.
+    The state is rebuilt from the frame on first use, when the last committed bar has dropped
+    out of the frame (a gap or a long outage) or when the provider has revised its close.
+    It is also rebuilt when the frame has slid past the bar the state started from and holds fewer
+    than `warmup_bars` closed bars: the values would otherwise depend on history the frame no
+    longer has, i.e. on how long the process has been running. Frames of at least `warmup_bars`
+    closed bars resume, and match pandas_ta on the frame once the smoothing seeds have decayed.
+    """
+
+    def __init__(self, keep_rows=3, warmup_bars=WARMUP_BARS):
+        self.keep_rows, self.warmup_bars = keep_rows, warmup_bars
+        self._series = {}
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def _rebuild(self, closed):
+        series = _SeriesState(self.keep_rows - 1)
+        if len(closed): series.first_time = closed['time'].iloc[0]
+        self._advance(series, closed)
+        return series
+
+    def _advance(self, series, closed):
+        for row in closed.to_dict('records'):
+            values = series.indicators.update(row['close'])
+            series.recent.append({**row, **values})
+            series.last_time, series.last_close = row['time'], row['close']
+
+    def _resume_position(self, series, closed):
+        """Index of the first closed bar after the committed one, or None if we can't resume from it."""
+        if series is None or series.last_time is None: return None
+        pos = closed['time'].searchsorted(series.last_time)
+        if pos >= len(closed) or closed['time'].iloc[pos] != series.last_time: return None
+        if not math.isclose(closed['close'].iloc[pos], series.last_close, rel_tol=1e-9): return None
+        if len(closed) < self.warmup_bars and closed['time'].iloc[0] > series.first_time: return None
+        return pos + 1
+
+    def latest_rows(self, key, df):
+        """
+        Advances the state for `key` with the cleaned frame `df` and returns its last `keep_rows`
+        bars with indicator columns attached, ready for apply_strategy_rules.
+        """
+        closed, forming = df.iloc[:-1], df.iloc[-1]
+        # Different series can advance in parallel; the same series never does
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            series = self._series.get(key)
+            pos = self._resume_position(series, closed)
+            if pos is None:
+                series = self._series[key] = self._rebuild(closed)
+            else:
+                self._advance(series, closed.iloc[pos:])
+            forming_values = series.indicators.copy().update(forming['close'])
+            rows = list(series.recent) + [{**forming.to_dict(), **forming_values}]
+        return pd.DataFrame(rows, columns=list(df.columns) + list(forming_values)).astype({col: float for col in forming_values})
+
+    def reset(self, key=None):
+        with self._lock:
+            if key is None: self._series.clear()
+            else: self._series.pop(key, None)
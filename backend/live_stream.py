@@ -0,0 +1,79 @@
+#
+# Server-sent events for the live signal feed.
+# The worker publishes one event per trade it opens or closes; dashboards subscribe to
+# /api/live-signals/stream instead of polling /api/live-signals.
+#
+
+import itertools
+import queue
+import threading
+from collections import deque
+
+
+def format_sse(data, event_type=None, event_id=None):
+    lines = []
+    if event_id is not None: lines.append(f"id: {event_id}")
+    if event_type: lines.append(f"event: {event_type}")
+    lines.extend(f"data: {line}" for line in data.splitlines() or [''])
+    return "\n".join(lines) + "\n\n"
+
+
+class _Subscriber:
+    __slots__ = ('queue', 'dropped')
+
+    def __init__(self, size):
+        self.queue, self.dropped = queue.Queue(maxsize=size), False
+
+
+class LocalBroker:
+    """
+    In-process fan-out used when no Redis is configured. Only subscribers connected to the same
+    process see the events, which matches a single web process running the worker.
+    Recent events are kept so a reconnecting EventSource can catch up from its Last-Event-ID;
+    a subscriber that falls `queue_size` events behind is dropped and does the same.
+    """
+
+    def __init__(self, history=200, queue_size=100, keepalive=15):
+        self.queue_size, self.keepalive = queue_size, keepalive
+        self._history = deque(maxlen=history)
+        self._subscribers = set()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def publish(self, data, event_type='message'):
+        with self._lock:
+            event = (next(self._ids), event_type, data)
+            self._history.append(event)
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.queue.put_nowait(event)
+            except queue.Full:
+                subscriber.dropped = True
+                with self._lock: self._subscribers.discard(subscriber)
+
+    def stream(self, last_event_id=None):
+        """Generator of SSE-formatted chunks for one client; ends when the client is dropped."""
+        subscriber = _Subscriber(self.queue_size)
+        with self._lock:
+            self._subscribers.add(subscriber)
+            backlog = [event for event in self._history if last_event_id is not None and event[0] > last_event_id]
+        try:
+            yield "retry: 5000\n\n"
+            for event_id, event_type, data in backlog:
+                yield format_sse(data, event_type, event_id)
+            while not subscriber.dropped:
+                try:
+                    event_id, event_type, data = subscriber.queue.get(timeout=self.keepalive)
+                except queue.Empty:
+                    # Comment line keeps proxies from closing an idle connection
+                    yield ": keepalive\n\n"
+                    continue
+                if backlog and event_id <= backlog[-1][0]: continue
+                yield format_sse(data, event_type, event_id)
+        finally:
+            with self._lock: self._subscribers.discard(subscriber)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
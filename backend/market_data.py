@@ -0,0 +1,298 @@
+#
+# Market data helpers shared by the watchlist worker and the backtest API.
+#
+
+import json
+import os
+import re
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from concurrent.futures import wait
+import numpy as np
+import yfinance as yf
+import pandas as pd
+from metrics import timed
+from bars import INTERVAL_MINUTES, history_days, resample_ohlcv
+from bar_schedule import session_times
+
+
+# --- ROBUST DATA CLEANING FUNCTION ---
+@timed('clean_yfinance_data')
+def clean_yfinance_data(df):
+    if isinstance(df.columns, pd.MultiIndex): df.columns = df.columns.droplevel(1)
+    df = df.reset_index()
+    df.columns = [col.lower() for col in df.columns]
+    # Reliably find and rename the date column
+    date_col_name = 'index'
+    if 'date' in df.columns: date_col_name = 'date'
+    if 'datetime' in df.columns: date_col_name = 'datetime'
+    df.rename(columns={date_col_name: 'time'}, inplace=True)
+    return df
+
+
+# --- BASE INTERVALS FOR LOCAL RESAMPLING (see bars.py) ---
+# How far back Yahoo serves each intraday interval
+MAX_HISTORY_DAYS = {'1m': 7, '2m': 60, '5m': 60, '15m': 60, '30m': 60, '90m': 60, '60m': 730, '1h': 730}
+def plan_base_intervals(watchlist):
+    """
+    Maps every (symbol, interval) pair in the watchlist to the interval it is downloaded at:
+    the symbol's finest intraday interval when the target is a whole multiple of it,
+    otherwise the target itself.
+    """
+    intervals_by_symbol = {}
+    for cfg in watchlist:
+        intervals_by_symbol.setdefault(cfg['symbol'], set()).add(cfg['timeframe'])
+    plan = {}
+    for symbol, intervals in intervals_by_symbol.items():
+        intraday = [i for i in intervals if i in INTERVAL_MINUTES]
+        base = min(intraday, key=INTERVAL_MINUTES.get) if intraday else None
+        for interval in intervals:
+            resamplable = base and interval in INTERVAL_MINUTES and INTERVAL_MINUTES[interval] % INTERVAL_MINUTES[base] == 0
+            plan[(symbol, interval)] = base if resamplable else interval
+    return plan
+
+
+# --- BATCHED WATCHLIST FETCH ---
+def _split_bulk_download(data, symbols):
+    """Splits a yf.download(group_by='ticker') frame into one raw frame per symbol."""
+    frames = {}
+    for symbol in symbols:
+        if isinstance(data.columns, pd.MultiIndex):
+            if symbol not in data.columns.get_level_values(0): continue
+            frame = data[symbol]
+        else:
+            # A single-ticker download may come back without the ticker level
+            frame = data
+        frame = frame.dropna(how='all')
+        if not frame.empty: frames[symbol] = frame
+    return frames
+
+
+def to_session_tz(df, symbol):
+    """
+    Puts a cleaned frame's times in the symbol's session timezone (London for forex, UTC for crypto),
+    which is what Ticker.history returns and what bar_schedule aligns to. A multi-ticker download
+    that mixes asset classes comes back in UTC, and daily downloads can come back naive in the
+    exchange's local time; both would otherwise resample onto different bar boundaries.
+    """
+    df['time'] = session_times(symbol, df['time'])
+    return df
+
+
+def _download_interval(symbols, period, interval, timeout):
+    """One multi-ticker request for every symbol at `interval`, plus single-symbol retries for anything it missed."""
+    raw_frames = {}
+    try:
+        data = yf.download(symbols, period=period, interval=interval, auto_adjust=True, ignore_tz=False, group_by='ticker', threads=True, progress=False, timeout=timeout)
+        if not data.empty: raw_frames = _split_bulk_download(data, symbols)
+    except Exception:
+        print(f"--- Bulk download failed for interval {interval}, falling back to per-symbol requests ---")
+        traceback.print_exc()
+    for symbol in symbols:
+        if symbol not in raw_frames:
+            try:
+                data = yf.Ticker(symbol).history(period=period, interval=interval, auto_adjust=True, timeout=timeout)
+                if not data.empty: raw_frames[symbol] = data
+            except Exception:
+                traceback.print_exc()
+    return {symbol: to_session_tz(clean_yfinance_data(frame), symbol) for symbol, frame in raw_frames.items()}
+
+
+def _timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - started) * 1000
+
+
+@timed('fetch_watchlist_data')
+def fetch_watchlist_data(watchlist, period='5d', executor=None, timeout=10, stats=None, only=None, min_bars=None):
+    """
+    Downloads the base series for every watchlist symbol exactly once and derives the other
+    timeframes from it with resample_ohlcv (see plan_base_intervals).
+    All symbols sharing a base interval go out in a single multi-ticker request, and any
+    symbol missing from the bulk result is retried on its own.
+    With an `executor` the per-interval downloads run concurrently; each gets `timeout` seconds
+    per HTTP request and the whole fetch stops waiting after twice that (bulk + retry pass).
+    Intervals still outstanding then are reported in stats['timed_out'] and left out.
+    `only` restricts the result (and the downloads) to a subset of (symbol, interval) pairs while
+    keeping the base intervals planned for the whole watchlist.
+    With `min_bars`, a base interval's download reaches back further than `period` where needed
+    for every series derived from it to have that many bars (see history_days).
+    Returns {(symbol, interval): cleaned DataFrame}; pairs without data are left out.
+    """
+    plan = plan_base_intervals(watchlist)
+    if only is not None: plan = {key: base for key, base in plan.items() if key in only}
+    symbols_by_interval = {}
+    for (symbol, _), base in plan.items():
+        symbols_by_interval.setdefault(base, set()).add(symbol)
+    periods = {base: period for base in symbols_by_interval}
+    if min_bars:
+        now = pd.Timestamp.now(tz='UTC')
+        for (_, interval), base in plan.items():
+            longer = f"{min(history_days(interval, min_bars), MAX_HISTORY_DAYS.get(base, 3650))}d"
+            current = period_start(periods[base], now)
+            if current is not None and period_start(longer, now) < current: periods[base] = longer
+
+    stats = stats if stats is not None else {}
+    stats.update({'intervals_ms': {}, 'timed_out': []})
+    results = {}
+    if executor is None:
+        for interval, symbols in symbols_by_interval.items():
+            results[interval], stats['intervals_ms'][interval] = _timed(_download_interval, sorted(symbols), periods[interval], interval, timeout)
+    else:
+        futures = {executor.submit(_timed, _download_interval, sorted(symbols), periods[interval], interval, timeout): interval for interval, symbols in symbols_by_interval.items()}
+        done, pending = wait(futures, timeout=timeout * 2)
+        for future in done:
+            try:
+                results[futures[future]], stats['intervals_ms'][futures[future]] = future.result()
+            except Exception:
+                traceback.print_exc()
+        for future in pending:
+            future.cancel()
+            stats['timed_out'].append(futures[future])
+
+    base_data = {}
+    for interval, frames in results.items():
+        for symbol, frame in frames.items():
+            base_data[(symbol, interval)] = frame
+
+    market_data = {}
+    for (symbol, interval), base in plan.items():
+        base_df = base_data.get((symbol, base))
+        if base_df is None: continue
+        market_data[(symbol, interval)] = base_df if base == interval else resample_ohlcv(base_df, interval)
+    return market_data
+
+
+# --- OHLCV CACHE FOR BACKTESTS ---
+# Tier 1: in-memory LRU of cleaned frames keyed by (symbol, period, interval), each valid for its interval's TTL.
+# Tier 2: one memory-mapped .npy per (symbol, interval) on disk. A stale entry is extended by
+# downloading only the bars since its last stored bar instead of the whole period again.
+CACHE_TTL_SECONDS = {'1m': 30, '2m': 60, '5m': 60, '15m': 120, '30m': 300, '60m': 300, '90m': 600, '1h': 300, '4h': 900, '1d': 3600}
+STORE_DTYPE = np.dtype([('time', 'i8'), ('open', 'f8'), ('high', 'f8'), ('low', 'f8'), ('close', 'f8'), ('volume', 'f8')])
+
+
+def period_start(period, now=None):
+    """Start timestamp (UTC) of a yfinance period string like '60d', '6mo' or '2y'; None for 'max'/'ytd' or anything unrecognised."""
+    match = re.fullmatch(r'(\d+)(d|wk|mo|y)', period or '')
+    if not match: return None
+    count, unit = int(match.group(1)), match.group(2)
+    offset = {'d': pd.DateOffset(days=count), 'wk': pd.DateOffset(weeks=count), 'mo': pd.DateOffset(months=count), 'y': pd.DateOffset(years=count)}[unit]
+    return (now or pd.Timestamp.now(tz='UTC')) - offset
+
+
+def _to_store(df):
+    records = np.empty(len(df), dtype=STORE_DTYPE)
+    records['time'] = pd.DatetimeIndex(df['time']).as_unit('ns').asi8
+    for col in ('open', 'high', 'low', 'close', 'volume'):
+        records[col] = df[col].to_numpy(dtype=float) if col in df.columns else 0.0
+    return records
+
+
+def _from_store(records, tz):
+    df = pd.DataFrame({col: np.asarray(records[col]) for col in ('open', 'high', 'low', 'close', 'volume')})
+    times = pd.to_datetime(np.asarray(records['time']), unit='ns', utc=True)
+    df.insert(0, 'time', times.tz_convert(tz) if tz else times.tz_localize(None))
+    return df
+
+
+class OHLCVCache:
+    def __init__(self, store_dir, max_entries=64):
+        self.store_dir, self.max_entries = store_dir, max_entries
+        self._frames = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self.stats = {'memory_hits': 0, 'store_hits': 0, 'store_extensions': 0, 'misses': 0, 'bars_appended': 0}
+
+    def _count(self, name, amount=1):
+        with self._lock: self.stats[name] += amount
+
+    def _paths(self, symbol, interval):
+        name = re.sub(r'[^A-Za-z0-9._-]', '_', f"{symbol}_{interval}")
+        return os.path.join(self.store_dir, f"{name}.npy"), os.path.join(self.store_dir, f"{name}.json")
+
+    def _load_store(self, symbol, interval):
+        data_path, meta_path = self._paths(symbol, interval)
+        if not (os.path.exists(data_path) and os.path.exists(meta_path)): return None, None
+        try:
+            with open(meta_path) as f: meta = json.load(f)
+            return np.load(data_path, mmap_mode='r'), meta
+        except Exception:
+            traceback.print_exc()
+            return None, None
+
+    def _save_store(self, symbol, interval, records, meta):
+        os.makedirs(self.store_dir, exist_ok=True)
+        data_path, meta_path = self._paths(symbol, interval)
+        # Write-then-rename so readers holding a memory map never see a half-written file
+        with open(data_path + '.tmp', 'wb') as f: np.save(f, records)
+        os.replace(data_path + '.tmp', data_path)
+        with open(meta_path + '.tmp', 'w') as f: json.dump(meta, f)
+        os.replace(meta_path + '.tmp', meta_path)
+
+    def _download(self, symbol, interval, **kwargs):
+        data = yf.Ticker(symbol).history(interval=interval, auto_adjust=True, **kwargs)
+        return None if data.empty else clean_yfinance_data(data)
+
+    def _refresh_store(self, symbol, period, interval, start):
+        """Returns the stored bars for (symbol, interval), downloading whatever is missing for `start` onwards."""
+        records, meta = self._load_store(symbol, interval)
+        now = time.time()
+        if records is not None and len(records) and meta['start'] <= start.value:
+            if now - meta['updated_at'] < CACHE_TTL_SECONDS.get(interval, 300):
+                self._count('store_hits')
+                return records, meta['tz']
+            # The last stored bar may have been incomplete, so re-download from it onwards
+            last_time = pd.Timestamp(int(records['time'][-1]), unit='ns', tz='UTC')
+            try:
+                fresh = self._download(symbol, interval, start=last_time)
+            except Exception:
+                traceback.print_exc(); fresh = None
+            if fresh is not None:
+                new_records, stored_bars = _to_store(fresh), len(records)
+                kept = np.asarray(records[records['time'] < new_records['time'][0]])
+                records = np.concatenate([kept, new_records])
+                meta['updated_at'] = now
+                self._save_store(symbol, interval, records, meta)
+                self._count('store_extensions'); self._count('bars_appended', len(records) - stored_bars)
+                return records, meta['tz']
+        # Nothing usable on disk (or it doesn't reach back far enough): download the whole period
+        self._count('misses')
+        fresh = self._download(symbol, interval, period=period)
+        if fresh is None: return None, None
+        tz = str(fresh['time'].dt.tz) if fresh['time'].dt.tz is not None else None
+        records = _to_store(fresh)
+        self._save_store(symbol, interval, records, {'start': min(start.value, int(records['time'][0])), 'updated_at': now, 'tz': tz})
+        return records, tz
+
+    def get(self, symbol, period, interval):
+        """Cleaned OHLCV frame for a backtest request, or None if the provider has no data. Callers get their own copy."""
+        key = (symbol, period, interval)
+        with self._lock:
+            cached = self._frames.get(key)
+            if cached and time.time() - cached[0] < CACHE_TTL_SECONDS.get(interval, 300):
+                self._frames.move_to_end(key)
+                self.stats['memory_hits'] += 1
+                return cached[1].copy()
+            key_lock = self._key_locks.setdefault((symbol, interval), threading.Lock())
+        with key_lock:
+            start = period_start(period)
+            if start is None:
+                # 'max' / 'ytd' can't be sliced from the store reliably, so they only use the memory tier
+                self._count('misses')
+                df = self._download(symbol, interval, period=period)
+            else:
+                records, tz = self._refresh_store(symbol, period, interval, start)
+                df = None if records is None else _from_store(records[records['time'] >= start.value], tz)
+        if df is None or df.empty: return None
+        with self._lock:
+            self._frames[key] = (time.time(), df)
+            self._frames.move_to_end(key)
+            while len(self._frames) > self.max_entries: self._frames.popitem(last=False)
+        return df.copy()
+
+    def get_stats(self):
+        with self._lock:
+            return {**self.stats, 'memory_entries': len(self._frames)}
@@ -0,0 +1,87 @@
+#
+# Opt-in per-stage latency histograms for the signal and backtest pipeline, served at /api/metrics.
+# Set STAGE_TIMING=1 to enable them; otherwise @timed leaves functions untouched, so the hooks
+# cost nothing in normal runs.
+#
+
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+STAGE_TIMING = os.getenv('STAGE_TIMING', '0') == '1'
+LATENCY_BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+
+class LatencyHistogram:
+    """Fixed-bucket histogram. Percentiles are reported as the upper bound of the bucket they fall in."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count, self.total_ms, self.max_ms = 0, 0.0, 0.0
+
+    def observe(self, ms):
+        index = next((i for i, bound in enumerate(self.buckets) if ms <= bound), len(self.buckets))
+        self.counts[index] += 1
+        self.count += 1; self.total_ms += ms; self.max_ms = max(self.max_ms, ms)
+
+    def percentile(self, q):
+        if not self.count: return 0.0
+        target, seen = q * self.count, 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target: return round(min(bound, self.max_ms), 3)
+        return round(self.max_ms, 3)
+
+    def snapshot(self):
+        buckets = {f"le_{bound}": count for bound, count in zip(self.buckets, self.counts)}
+        buckets['le_inf'] = self.counts[-1]
+        return {
+            'count': self.count, 'mean_ms': round(self.total_ms / self.count, 3) if self.count else 0.0, 'max_ms': round(self.max_ms, 3),
+            'p50_ms': self.percentile(0.5), 'p95_ms': self.percentile(0.95), 'p99_ms': self.percentile(0.99), 'buckets': buckets,
+        }
+
+
+class StageMetrics:
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage, ms):
+        with self._lock:
+            histogram = self._stages.get(stage)
+            if histogram is None: histogram = self._stages[stage] = LatencyHistogram()
+            histogram.observe(ms)
+
+    @contextmanager
+    def time(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, (time.perf_counter() - started) * 1000)
+
+    def timed(self, stage):
+        """Decorator recording every call's latency under `stage`. A no-op unless enabled at import time."""
+        def decorator(func):
+            if not self.enabled: return func
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.time(stage):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def snapshot(self):
+        with self._lock:
+            return {stage: histogram.snapshot() for stage, histogram in sorted(self._stages.items())}
+
+    def reset(self):
+        with self._lock: self._stages.clear()
+
+
+STAGE_METRICS = StageMetrics(STAGE_TIMING)
+timed = STAGE_METRICS.timed
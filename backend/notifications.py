@@ -0,0 +1,191 @@
+#
+# Background Discord webhook dispatcher for the worker's entry/exit notifications.
+# The worker only enqueues embeds; a daemon thread batches them into messages (Discord takes up
+# to 10 embeds per message), posts them on a pooled session with timeouts, waits out 429s and
+# backs off on errors. Messages it can't deliver go to a JSON-lines spool file and are retried
+# later, including after a restart.
+#
+
+import atexit
+import json
+import os
+import queue
+import random
+import threading
+import time
+import traceback
+import requests
+from requests.adapters import HTTPAdapter
+
+MAX_EMBEDS_PER_MESSAGE = 10
+
+
+class DiscordDispatcher:
+    """
+    One queue and one sender thread per process. A message is retried `max_retries` times with
+    exponential backoff on timeouts and 5xx, and after any 429 wait; then it is spooled.
+    """
+
+    def __init__(self, webhook_url, spool_path=None, linger=1.0, timeout=(3.05, 10), max_retries=5, queue_size=1000, spool_retry=60):
+        self.webhook_url, self.spool_path = webhook_url, spool_path
+        self.linger, self.timeout, self.max_retries, self.spool_retry = linger, timeout, max_retries, spool_retry
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._spool_lock = threading.Lock()
+        self._idle = threading.Event(); self._idle.set()
+        self.stats = {'queued': 0, 'messages_sent': 0, 'embeds_sent': 0, 'rate_limited': 0, 'retries': 0, 'rejected': 0, 'spooled': 0, 'respooled_sent': 0}
+        atexit.register(self._spool_queued)
+
+    def _count(self, name, amount=1):
+        with self._lock: self.stats[name] += amount
+
+    def enqueue(self, embed):
+        """Queues one embed for delivery. Never blocks: if the queue is full the embed is spooled to disk instead."""
+        self.start()
+        self._idle.clear()
+        try:
+            self._queue.put_nowait(embed)
+            self._count('queued')
+        except queue.Full:
+            self._spool([embed])
+
+    def start(self):
+        # Also started on first use, so forked or spawned processes that never notify never run a thread
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='discord-dispatcher', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        last_spool_attempt = None
+        while True:
+            batch = []
+            # Any error is logged and the loop carries on: this thread is the only sender for the process
+            try:
+                if self._queue.empty() and (last_spool_attempt is None or time.monotonic() - last_spool_attempt >= self.spool_retry):
+                    last_spool_attempt = time.monotonic()
+                    self._redeliver_spool()
+                try:
+                    batch.append(self._queue.get(timeout=self.spool_retry))
+                except queue.Empty:
+                    pass
+                if batch:
+                    # Give the rest of the cycle's notifications `linger` seconds to join this message
+                    deadline = time.monotonic() + self.linger
+                    while len(batch) < MAX_EMBEDS_PER_MESSAGE:
+                        try:
+                            batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                        except queue.Empty:
+                            break
+                    if not self._deliver(batch): self._spool(batch)
+            except Exception:
+                traceback.print_exc()
+                if batch:
+                    try: self._spool(batch)
+                    except Exception: traceback.print_exc()
+                time.sleep(1)
+            if self._queue.empty(): self._idle.set()
+
+    def _deliver(self, embeds):
+        """Posts one message. Returns True once Discord accepted or definitively rejected it, False to spool it."""
+        for attempt in range(self.max_retries + 1):
+            if attempt: self._count('retries')
+            try:
+                response = self.session.post(self.webhook_url, json={"embeds": embeds}, timeout=self.timeout)
+            except requests.RequestException as e:
+                print(f"Error sending Discord notification: {e}")
+                time.sleep(min(30, 2 ** attempt) + random.random())
+                continue
+            if response.status_code == 429:
+                self._count('rate_limited')
+                time.sleep(self._retry_after(response))
+                continue
+            if response.status_code >= 500:
+                time.sleep(min(30, 2 ** attempt) + random.random())
+                continue
+            if response.status_code >= 400:
+                # A malformed message fails the same way every time, so it isn't worth spooling
+                print(f"Discord rejected a notification ({response.status_code}): {response.text[:200]}")
+                self._count('rejected')
+                return True
+            self._count('messages_sent'); self._count('embeds_sent', len(embeds))
+            # Respect the bucket before it's exhausted rather than collecting a 429 next time
+            if response.headers.get('X-RateLimit-Remaining') == '0':
+                time.sleep(float(response.headers.get('X-RateLimit-Reset-After', 1)))
+            return True
+        return False
+
+    @staticmethod
+    def _retry_after(response):
+        try:
+            body = response.json()
+            if isinstance(body, dict) and 'retry_after' in body: return max(0.0, float(body['retry_after']))
+        except (ValueError, TypeError):
+            pass
+        try:
+            return max(0.0, float(response.headers.get('Retry-After', 1)))
+        except (ValueError, TypeError):
+            return 1.0
+
+    def _spool(self, embeds):
+        if not self.spool_path:
+            print(f"--- Dropped {len(embeds)} undeliverable Discord notification(s) ---")
+            return
+        with self._spool_lock:
+            with open(self.spool_path, 'a') as f:
+                for start in range(0, len(embeds), MAX_EMBEDS_PER_MESSAGE):
+                    f.write(json.dumps({"embeds": embeds[start:start + MAX_EMBEDS_PER_MESSAGE]}) + "\n")
+        self._count('spooled', len(embeds))
+
+    def _redeliver_spool(self):
+        """
+        Retries the spool. It is moved aside first so new failures can keep appending; a '.sending'
+        file left by a crash is picked up again, so delivery is at-least-once.
+        """
+        if not self.spool_path: return
+        sending = self.spool_path + '.sending'
+        with self._spool_lock:
+            if os.path.exists(self.spool_path) and not os.path.exists(sending): os.replace(self.spool_path, sending)
+        if not os.path.exists(sending): return
+        messages, malformed = [], 0
+        with open(sending) as f:
+            for line in f:
+                if not line.strip(): continue
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    message = None
+                # A line that can't be sent is dropped rather than blocking the rest of the spool
+                if isinstance(message, dict) and isinstance(message.get('embeds'), list) and message['embeds']: messages.append(message)
+                else: malformed += 1
+        if malformed: print(f"--- Skipped {malformed} malformed line(s) in the Discord spool ---")
+        if messages: print(f"--- Redelivering {len(messages)} spooled Discord message(s) ---")
+        for i, message in enumerate(messages):
+            if not self._deliver(message['embeds']):
+                # Still failing: put this and everything after it back and try again later
+                for rest in messages[i:]: self._spool(rest['embeds'])
+                break
+            self._count('respooled_sent', len(message['embeds']))
+        os.remove(sending)
+
+    def _spool_queued(self):
+        """On interpreter exit, whatever is still queued goes to the spool instead of being lost."""
+        pending = []
+        while True:
+            try: pending.append(self._queue.get_nowait())
+            except queue.Empty: break
+        if pending: self._spool(pending)
+
+    def flush(self, timeout=None):
+        """Waits until the queue has drained. Returns False on timeout."""
+        return self._idle.wait(timeout)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats['queue_depth'] = self._queue.qsize()
+        stats['spool_pending'] = bool(self.spool_path) and (os.path.exists(self.spool_path) or os.path.exists(self.spool_path + '.sending'))
+        return stats
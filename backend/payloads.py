@@ -0,0 +1,87 @@
+#
+# Compact response encodings for /api/backtest.
+# The "columnar" format sends each table as parallel arrays ({column: [values]}) with times as
+# epoch milliseconds, and thins the equity curve to a target number of points with LTTB.
+#
+
+import math
+import numpy as np
+import pandas as pd
+
+DEFAULT_CHART_COLUMNS = ('time', 'open', 'high', 'low', 'close', 'signal')
+DEFAULT_EQUITY_POINTS = 1000
+MAX_EQUITY_POINTS = 20000
+
+
+def lttb_indices(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets: indices of `threshold` points that keep the visual shape of
+    (x, y). The first and last points are always kept; series already short enough are returned whole.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3: return np.arange(n)
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    # Bucket edges for the n - 2 interior points
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    selected = np.empty(threshold, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        # Average of the next bucket (or the last point) is the triangle's third vertex
+        next_start, next_end = end, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x, avg_y = x[next_start:next_end].mean(), y[next_start:next_end].mean()
+        areas = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(areas.argmax())
+        selected[i + 1] = a
+    return selected
+
+
+def _column_values(series):
+    if series.dtype == object and pd.api.types.infer_dtype(series, skipna=True) == 'datetime':
+        # Timestamps from several timezones share no dtype; epoch milliseconds only need the instant
+        series = pd.to_datetime(series, utc=True)
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return pd.DatetimeIndex(series).as_unit('ms').asi8.tolist()
+    if pd.api.types.is_float_dtype(series):
+        # JSON has no NaN; chart libraries treat null as a gap
+        return [None if math.isnan(v) else v for v in series.tolist()]
+    return series.tolist()
+
+
+def frame_to_columns(df, columns=None):
+    """{column: [values]} for the chosen columns of a DataFrame."""
+    return {col: _column_values(df[col]) for col in (columns or df.columns)}
+
+
+def records_to_columns(records, columns):
+    """{column: [values]} for a list of dicts (trades, equity points)."""
+    return frame_to_columns(pd.DataFrame.from_records(records, columns=columns))
+
+
+def equity_to_columns(equity_curve, points):
+    if not equity_curve: return {'time': [], 'capital': []}
+    equity = pd.DataFrame.from_records(equity_curve, columns=['time', 'capital'])
+    times = pd.DatetimeIndex(equity['time']).as_unit('ms').asi8
+    keep = lttb_indices(times, equity['capital'].to_numpy(dtype=float), points)
+    return {'time': times[keep].tolist(), 'capital': equity['capital'].to_numpy(dtype=float)[keep].round(2).tolist()}
+
+
+TRADE_COLUMNS = ['entry_date', 'type', 'entry_price', 'stop_loss', 'take_profit', 'position_size', 'exit_price', 'pnl', 'exit_reason']
+
+
+def columnar_backtest_response(results, signals_df, chart_columns, chart_rows, equity_points):
+    """The /api/backtest body in the columnar format."""
+    total_points = len(results['equityCurve'])
+    body = {
+        "format": "columnar",
+        "performance": results.get('performance'),
+        "trades": records_to_columns(results['trades'], TRADE_COLUMNS),
+        "equityCurve": equity_to_columns(results['equityCurve'], equity_points),
+        "equityPoints": {"total": total_points, "returned": min(total_points, equity_points)},
+    }
+    if "error" in results:
+        body["error"] = results["error"]
+    else:
+        body["chartData"] = frame_to_columns(signals_df.tail(chart_rows), chart_columns)
+    return body
@@ -0,0 +1,125 @@
+#
+# Schema migrations for the live_signals tables. Each migration runs once, in order, and is
+# recorded in schema_migrations; the whole run is one transaction under an advisory lock, so
+# several web processes starting together apply it exactly once.
+#
+#   python schema.py        # apply pending migrations to $DATABASE_URL
+#
+
+import os
+from db import ConnectionPool
+
+MIGRATION_LOCK_ID = 724_311_001
+
+MIGRATIONS = [
+    (1, "live_signals table", """
+        CREATE TABLE IF NOT EXISTS live_signals (
+            id SERIAL PRIMARY KEY,
+            symbol TEXT NOT NULL,
+            strategy TEXT NOT NULL,
+            timeframe TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'active',
+            trade_type TEXT NOT NULL,
+            entry_price NUMERIC,
+            stop_loss NUMERIC,
+            take_profit NUMERIC,
+            entry_date TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            exit_price NUMERIC,
+            exit_date TIMESTAMPTZ,
+            exit_reason TEXT
+        );
+    """),
+    (2, "live_signals indexes", """
+        -- The worker's open-trade lookup and /api/get-latest-signal only ever read active rows
+        CREATE INDEX IF NOT EXISTS live_signals_active_config ON live_signals (symbol, strategy, timeframe) WHERE status = 'active';
+        CREATE INDEX IF NOT EXISTS live_signals_active_entry ON live_signals (entry_date DESC) WHERE status = 'active';
+        -- Newest-first listing and keyset pagination, unfiltered and filtered by config
+        CREATE INDEX IF NOT EXISTS live_signals_entry_keyset ON live_signals (entry_date DESC, id DESC);
+        CREATE INDEX IF NOT EXISTS live_signals_symbol_keyset ON live_signals (symbol, entry_date DESC, id DESC);
+        CREATE INDEX IF NOT EXISTS live_signals_strategy_keyset ON live_signals (strategy, timeframe, entry_date DESC, id DESC);
+        -- ?since= polling and the ETag's MAX(exit_date)
+        CREATE INDEX IF NOT EXISTS live_signals_exit_date ON live_signals (exit_date DESC) WHERE exit_date IS NOT NULL;
+    """),
+    (3, "per-strategy PnL summary", """
+        CREATE TABLE IF NOT EXISTS live_signal_pnl (
+            strategy TEXT NOT NULL,
+            timeframe TEXT NOT NULL,
+            closed_trades INTEGER NOT NULL DEFAULT 0,
+            wins INTEGER NOT NULL DEFAULT 0,
+            total_return_pct DOUBLE PRECISION NOT NULL DEFAULT 0,
+            gross_profit_pct DOUBLE PRECISION NOT NULL DEFAULT 0,
+            gross_loss_pct DOUBLE PRECISION NOT NULL DEFAULT 0,
+            last_exit_date TIMESTAMPTZ,
+            PRIMARY KEY (strategy, timeframe)
+        );
+        -- Backfill from the trades closed before the summary existed
+        INSERT INTO live_signal_pnl (strategy, timeframe, closed_trades, wins, total_return_pct, gross_profit_pct, gross_loss_pct, last_exit_date)
+        SELECT strategy, timeframe, COUNT(*), COUNT(*) FILTER (WHERE r > 0), COALESCE(SUM(r), 0),
+               COALESCE(SUM(r) FILTER (WHERE r > 0), 0), COALESCE(-SUM(r) FILTER (WHERE r <= 0), 0), MAX(exit_date)
+        FROM (
+            SELECT strategy, timeframe, exit_date,
+                   (CASE WHEN trade_type = 'SHORT' THEN entry_price - exit_price ELSE exit_price - entry_price END) / entry_price * 100 AS r
+            FROM live_signals
+            WHERE status = 'closed' AND exit_price IS NOT NULL AND entry_price <> 0
+        ) AS closed
+        GROUP BY strategy, timeframe
+        ON CONFLICT (strategy, timeframe) DO NOTHING;
+    """),
+]
+
+
+def migrate(db_pool):
+    """Applies pending migrations. Returns the versions applied by this call."""
+    applied_now = []
+    with db_pool.cursor() as cur:
+        cur.execute("SELECT pg_advisory_xact_lock(%s);", (MIGRATION_LOCK_ID,))
+        cur.execute("CREATE TABLE IF NOT EXISTS schema_migrations (version INTEGER PRIMARY KEY, name TEXT NOT NULL, applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW());")
+        cur.execute("SELECT version FROM schema_migrations;")
+        applied = {row[0] for row in cur.fetchall()}
+        for version, name, sql in MIGRATIONS:
+            if version in applied: continue
+            cur.execute(sql)
+            cur.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s);", (version, name))
+            applied_now.append(version)
+            print(f"--- Applied schema migration {version}: {name} ---")
+    return applied_now
+
+
+def trade_return_pct(trade_type, entry_price, exit_price):
+    """A closed trade's return in percent of its entry price; the same formula as migration 3's backfill."""
+    entry_price, exit_price = float(entry_price), float(exit_price)
+    if not entry_price: return 0.0
+    move = entry_price - exit_price if trade_type == 'SHORT' else exit_price - entry_price
+    return move / entry_price * 100
+
+
+def pnl_summary_rows(closed_rows):
+    """
+    Folds closed live_signals rows (dicts with SIGNAL_COLUMNS) into one live_signal_pnl increment
+    per (strategy, timeframe), ready for PNL_UPSERT_SQL.
+    """
+    totals = {}
+    for row in closed_rows:
+        if row.get('exit_price') is None or row.get('entry_price') is None: continue
+        r = trade_return_pct(row['trade_type'], row['entry_price'], row['exit_price'])
+        closed, wins, total, profit, loss, last_exit = totals.get((row['strategy'], row['timeframe']), (0, 0, 0.0, 0.0, 0.0, None))
+        last_exit = row['exit_date'] if last_exit is None or (row['exit_date'] is not None and row['exit_date'] > last_exit) else last_exit
+        totals[(row['strategy'], row['timeframe'])] = (closed + 1, wins + (r > 0), total + r, profit + max(r, 0.0), loss + max(-r, 0.0), last_exit)
+    return [key + values for key, values in totals.items()]
+
+
+PNL_UPSERT_SQL = """
+    INSERT INTO live_signal_pnl AS p (strategy, timeframe, closed_trades, wins, total_return_pct, gross_profit_pct, gross_loss_pct, last_exit_date) VALUES %s
+    ON CONFLICT (strategy, timeframe) DO UPDATE SET
+        closed_trades = p.closed_trades + EXCLUDED.closed_trades,
+        wins = p.wins + EXCLUDED.wins,
+        total_return_pct = p.total_return_pct + EXCLUDED.total_return_pct,
+        gross_profit_pct = p.gross_profit_pct + EXCLUDED.gross_profit_pct,
+        gross_loss_pct = p.gross_loss_pct + EXCLUDED.gross_loss_pct,
+        last_exit_date = GREATEST(p.last_exit_date, EXCLUDED.last_exit_date);
+"""
+
+
+if __name__ == '__main__':
+    applied = migrate(ConnectionPool(os.getenv('DATABASE_URL'), maxconn=1))
+    print(f"Applied {len(applied)} migration(s)." if applied else "Schema is up to date.")
@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+# The backend is a flat set of modules run from backend/; tests import them the same way
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Importing app must not start the watchlist worker or touch a database
+os.environ.setdefault('RUN_SCHEDULER', '0')
+os.environ.setdefault('MIGRATE_ON_START', '0')
+
+
+@pytest.fixture
+def quarter_hours():
+    """Factory for flat 15-minute OHLCV frames: quarter_hours(start, days=5, tz='Europe/London')."""
+    def make(start, days=5, tz='Europe/London'):
+        times = pd.date_range(start, periods=days * 96, freq='15min', tz=tz)
+        return pd.DataFrame({'time': times, 'open': 1.0, 'high': 1.0, 'low': 1.0, 'close': 1.0, 'volume': 1.0})
+    return make
@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from backtest import compact_portfolio_arrays, run_backtest_arrays, run_backtest_simulation, run_portfolio_backtest
+from payloads import TRADE_COLUMNS, records_to_columns
+
+
+def make_signals(seed):
+    """A random signals frame: varying length, London or UTC times, and occasional NaN highs."""
+    rng = np.random.default_rng(seed)
+    n = int(rng.choice([10, 49, 51, 120, 400, 900]))
+    close = 1.1 * np.exp(np.cumsum(rng.normal(0, 2e-3, n)))
+    open_ = np.r_[close[0], close[:-1]]
+    high = np.maximum(open_, close) * (1 + rng.uniform(0, 2e-3, n))
+    low = np.minimum(open_, close) * (1 - rng.uniform(0, 2e-3, n))
+    if seed % 3 == 0: high[rng.integers(0, n, 5)] = np.nan
+    tz = 'Europe/London' if seed % 2 else 'UTC'
+    signal = rng.choice(['STAY_OUT'] * 6 + ['LONG', 'SHORT'], n)
+    return pd.DataFrame({'time': pd.date_range('2024-03-25', periods=n, freq='60min', tz=tz), 'open': open_, 'high': high, 'low': low, 'close': close, 'signal': signal})
+
+
+def make_params(seed):
+    rng = np.random.default_rng(10_000 + seed)
+    return (float(rng.choice([5000, 10000])), float(rng.uniform(0.5, 3.0)), int(rng.integers(1, 6)), float(rng.uniform(0.5, 2.5)),
+            float(rng.uniform(1.0, 4.0)), float(rng.uniform(0.0, 3.0)), float(rng.uniform(0.0, 5.0)))
+
+
+def equity(result):
+    return [(point['time'].value, point['capital']) for point in result['equityCurve']]
+
+
+@pytest.mark.parametrize('seed', range(150))
+def test_array_engine_matches_loop_engine(seed):
+    df, params = make_signals(seed), make_params(seed)
+    expected, actual = run_backtest_simulation(df, *params), run_backtest_arrays(df, *params)
+    assert actual['trades'] == expected['trades']
+    assert actual['performance'] == expected['performance']
+    assert actual.get('error') == expected.get('error')
+    assert equity(actual) == equity(expected)
+
+
+@pytest.mark.parametrize('seed', range(0, 150, 5))
+def test_single_instrument_portfolio_matches_array_engine(seed):
+    df, params = make_signals(seed), make_params(seed)
+    initial_capital, risk, max_per_day, atr_multiplier, target_multiplier, slippage, commission = params
+    expected = run_backtest_arrays(df, *params)
+    arrays = compact_portfolio_arrays(df, atr_multiplier, target_multiplier, slippage)
+    actual = run_portfolio_backtest([({}, arrays)], initial_capital, risk, max_per_day, commission, max_open_positions=1)
+    assert actual['trades'] == expected['trades']
+    assert actual['performance'] == expected['performance']
+    assert equity(actual) == equity(expected)
+
+
+def test_portfolio_across_timezones_sends_epoch_ms_trade_times():
+    # Odd seeds are London, even seeds UTC, as when the watchlist mixes forex and crypto
+    instruments = [({'symbol': str(seed)}, compact_portfolio_arrays(make_signals(seed), 1.0, 2.5, 1.5)) for seed in (5, 8, 9, 14)]
+    result = run_portfolio_backtest(instruments, 10000.0, 2.0, 5, 4.0, max_open_positions=4)
+    assert {str(trade['entry_date'].tz) for trade in result['trades']} == {'UTC'}
+    entry_dates = records_to_columns(result['trades'], TRADE_COLUMNS)['entry_date']
+    assert entry_dates and all(isinstance(value, int) for value in entry_dates)
@@ -0,0 +1,46 @@
+import pandas as pd
+import pytest
+
+from bar_schedule import BarCloseSchedule, bar_end_times, last_bar_end, session_times
+from bars import resample_ohlcv
+
+FOREX = 'EURUSD=X'
+
+
+@pytest.mark.parametrize('start', ['2024-03-28', '2024-10-24'])
+def test_schedule_boundaries_match_resampled_bars_across_dst(start, quarter_hours):
+    bars = resample_ohlcv(quarter_hours(start), '4h')
+    ends = bar_end_times(bars['time'], '4h')
+    for bar_start, bar_end in zip(bars['time'], ends):
+        # Just before the bar closes the latest boundary is its start; once it closes, its end
+        assert last_bar_end(FOREX, '4h', (bar_end - pd.Timedelta(seconds=1)).tz_convert('UTC')) == bar_start
+        assert last_bar_end(FOREX, '4h', bar_end.tz_convert('UTC')) == bar_end
+
+
+def test_series_is_not_due_before_its_bar_closes_after_dst():
+    schedule = BarCloseSchedule(grace=20)
+    key = (FOREX, '4h')
+    # Tuesday after the spring change: the 04:00-08:00 BST bar was evaluated
+    schedule.mark_evaluated(key, pd.Timestamp('2024-04-02 08:00', tz='Europe/London'))
+    assert not schedule.is_due(key, pd.Timestamp('2024-04-02 09:00', tz='Europe/London').tz_convert('UTC'))
+    assert schedule.is_due(key, pd.Timestamp('2024-04-02 12:00:30', tz='Europe/London').tz_convert('UTC'))
+
+
+def test_weekend_forex_is_idle_while_crypto_is_due():
+    schedule = BarCloseSchedule(grace=20)
+    key = (FOREX, '60m')
+    schedule.mark_evaluated(key, pd.Timestamp('2024-06-07 22:00', tz='UTC'))
+    assert not schedule.is_due(key, pd.Timestamp('2024-06-08 12:00:30', tz='UTC'))
+    assert schedule.is_due(('BTC-USD', '60m'), pd.Timestamp('2024-06-08 12:00:30', tz='UTC'))
+
+
+def test_naive_daily_bars_close_on_session_midnight():
+    # Yahoo's daily dates can come back naive; across both DST changes each bar closes on the next London midnight
+    times = pd.Series(pd.date_range('2024-03-29', periods=3, freq='D').append(pd.date_range('2024-10-26', periods=3, freq='D')))
+    ends = bar_end_times(session_times(FOREX, times), '1d')
+    now = pd.Timestamp('2024-10-29 00:00:30', tz='UTC')
+    assert (ends <= now).all()
+    for end in ends:
+        assert end.hour == 0 and end.minute == 0
+        assert last_bar_end(FOREX, '1d', end.tz_convert('UTC')) == end
+    assert str(session_times('BTC-USD', times).dt.tz) == 'UTC'
@@ -0,0 +1,53 @@
+import pandas as pd
+import pytest
+
+from bars import INTERVAL_MINUTES, bar_ends, bar_starts, history_days, resample_ohlcv
+
+
+@pytest.mark.parametrize('start', ['2024-03-28', '2024-10-24'])
+def test_4h_bars_stay_on_local_midnight_across_dst(start, quarter_hours):
+    bars = resample_ohlcv(quarter_hours(start), '4h')
+    assert (bars['time'].dt.hour % 4 == 0).all()
+    assert (bars['time'].dt.minute == 0).all()
+    # Every row lands in exactly one bar
+    assert bars['volume'].sum() == 5 * 96
+
+
+def test_dst_day_bars_cover_the_wall_clock_span(quarter_hours):
+    spring = resample_ohlcv(quarter_hours('2024-03-31', days=1), '4h').set_index('time')['volume']
+    assert spring.loc[pd.Timestamp('2024-03-31 00:00', tz='Europe/London')] == 12  # 00:00-04:00 is 3 hours
+    autumn = resample_ohlcv(quarter_hours('2024-10-27', days=1), '4h').set_index('time')['volume']
+    assert autumn.loc[pd.Timestamp('2024-10-27 00:00', tz='Europe/London')] == 20  # 00:00-04:00 is 5 hours
+
+
+def test_repeated_hour_keeps_two_hourly_bars(quarter_hours):
+    bars = resample_ohlcv(quarter_hours('2024-10-27', days=1), '60m')
+    repeated = bars[bars['time'].dt.tz_localize(None) == pd.Timestamp('2024-10-27 01:00')]
+    assert len(repeated) == 2
+    assert repeated['volume'].tolist() == [4.0, 4.0]
+
+
+def test_bar_ends_are_the_next_bar_start(quarter_hours):
+    for start in ('2024-03-28', '2024-10-24'):
+        frame = quarter_hours(start)
+        starts = pd.Series(resample_ohlcv(frame, '4h')['time'])
+        assert (bar_ends(starts, '4h').iloc[:-1].to_numpy() == starts.iloc[1:].to_numpy()).all()
+
+
+def test_matches_pandas_resample_away_from_dst(quarter_hours):
+    frame = quarter_hours('2024-06-03')
+    expected = frame.set_index('time').resample('4h', label='left', closed='left', origin='start_day').agg({'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last', 'volume': 'sum'}).reset_index()
+    pd.testing.assert_frame_equal(resample_ohlcv(frame, '4h'), expected, check_dtype=False)
+
+
+def test_utc_frames_are_unaffected(quarter_hours):
+    frame = quarter_hours('2024-03-28', tz='UTC')
+    assert (bar_starts(frame['time'], '4h') == frame['time'].dt.floor('4h')).all()
+
+
+@pytest.mark.parametrize('interval', ['5m', '30m', '60m', '4h', '1d'])
+def test_history_days_hold_the_bars_after_a_weekend(interval):
+    # Worst case for a weekday-only market: the window ends just after a whole weekend without bars
+    end = pd.Timestamp('2024-06-10 00:00', tz='UTC')
+    times = pd.date_range(end - pd.Timedelta(days=history_days(interval, 150)), end, freq=f"{INTERVAL_MINUTES.get(interval, 1440)}min", inclusive='left')
+    assert (times.dayofweek < 5).sum() >= 150
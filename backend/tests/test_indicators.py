@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('pandas_ta')
+from app import generate_signals
+from indicators import WARMUP_BARS, IncrementalIndicators
+
+KEY = ('EURUSD=X', '15m')
+
+
+def make_frame(n, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 1.1 * np.exp(np.cumsum(rng.normal(0, 1e-3, n)))
+    return pd.DataFrame({
+        'time': pd.date_range('2024-01-01', periods=n, freq='15min', tz='UTC'),
+        'open': np.r_[close[0], close[:-1]], 'high': close * 1.001, 'low': close * 0.999, 'close': close, 'volume': 0.0,
+    })
+
+
+def assert_matches_pandas_ta(rows, frame, rtol=1e-9, atol=1e-9):
+    expected = generate_signals(frame.copy(), 'momentum').tail(len(rows)).reset_index(drop=True)
+    indicator_columns = [col for col in rows.columns if col not in frame.columns]
+    assert indicator_columns
+    for col in indicator_columns:
+        np.testing.assert_allclose(rows[col].to_numpy(dtype=float), expected[col].to_numpy(dtype=float), rtol=rtol, atol=atol, err_msg=col)
+
+
+def test_growing_slices_match_pandas_ta():
+    frame, engine = make_frame(400), IncrementalIndicators(keep_rows=4)
+    for end in range(60, len(frame) + 1, 7):
+        assert_matches_pandas_ta(engine.latest_rows(KEY, frame.iloc[:end]), frame.iloc[:end])
+
+
+def test_revised_close_rebuilds_state():
+    frame, engine = make_frame(300, seed=1), IncrementalIndicators(keep_rows=4)
+    engine.latest_rows(KEY, frame.iloc[:250])
+    revised = frame.iloc[:260].copy()
+    # The provider corrects the last bar the engine committed
+    revised.loc[248, 'close'] *= 1.01
+    assert_matches_pandas_ta(engine.latest_rows(KEY, revised), revised)
+
+
+def test_committed_bar_outside_frame_rebuilds_state():
+    frame, engine = make_frame(400, seed=2), IncrementalIndicators(keep_rows=4)
+    engine.latest_rows(KEY, frame.iloc[:200])
+    # A gap: the window no longer contains the last committed bar
+    window = frame.iloc[220:400].reset_index(drop=True)
+    assert_matches_pandas_ta(engine.latest_rows(KEY, window), window)
+
+
+def test_short_sliding_window_matches_pandas_ta_on_that_window():
+    # Shorter than the warm-up: a long-running engine must not carry values from bars the window dropped
+    frame, engine = make_frame(400, seed=3), IncrementalIndicators(keep_rows=4)
+    for end in range(80, len(frame) + 1, 7):
+        window = frame.iloc[end - 80:end].reset_index(drop=True)
+        assert_matches_pandas_ta(engine.latest_rows(KEY, window), window)
+
+
+def test_warmed_up_sliding_window_does_not_depend_on_uptime():
+    frame, engine = make_frame(900, seed=4), IncrementalIndicators(keep_rows=4)
+    for end in range(WARMUP_BARS + 1, len(frame) + 1, 11):
+        window = frame.iloc[end - WARMUP_BARS - 1:end].reset_index(drop=True)
+        rows = engine.latest_rows(KEY, window)
+        # Resumed state agrees with pandas_ta on the window, and so with a freshly restarted engine
+        assert_matches_pandas_ta(rows, window, rtol=1e-4, atol=1e-5)
+        assert not rows['ema_50'].isna().any()
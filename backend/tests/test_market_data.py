@@ -0,0 +1,72 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('yfinance')
+import market_data
+from market_data import fetch_watchlist_data
+
+WATCHLIST = [
+    {'symbol': 'USDJPY=X', 'strategy': 'momentum', 'timeframe': '5m'},
+    {'symbol': 'USDJPY=X', 'strategy': 'momentum', 'timeframe': '4h'},
+    {'symbol': 'BTC-USD', 'strategy': 'momentum', 'timeframe': '5m'},
+    {'symbol': 'EURUSD=X', 'strategy': 'momentum', 'timeframe': '1d'},
+    {'symbol': 'BTC-USD', 'strategy': 'momentum', 'timeframe': '1d'},
+]
+
+
+def raw_bars(index):
+    close = np.linspace(1.0, 2.0, len(index))
+    return pd.DataFrame({'Open': close, 'High': close, 'Low': close, 'Close': close, 'Volume': 1.0}, index=index)
+
+
+def fake_download(symbols, period, interval, **kwargs):
+    """What yf.download returns for these groups: mixed forex and crypto in UTC, and naive daily dates."""
+    if interval == '1d':
+        index = pd.date_range('2024-06-03', periods=5, freq='D', name='Date')
+    else:
+        index = pd.date_range('2024-06-03 00:00', periods=3 * 288, freq='5min', tz='UTC', name='Datetime')
+    return pd.concat({symbol: raw_bars(index) for symbol in symbols}, axis=1)
+
+
+def no_single_requests(symbol):
+    raise AssertionError(f"unexpected per-symbol request for {symbol}")
+
+
+@pytest.fixture
+def fetched(monkeypatch):
+    monkeypatch.setattr(market_data, 'yf', SimpleNamespace(download=fake_download, Ticker=no_single_requests))
+    return fetch_watchlist_data(WATCHLIST)
+
+
+def test_frames_come_back_in_their_session_timezone(fetched):
+    assert str(fetched[('USDJPY=X', '5m')]['time'].dt.tz) == 'Europe/London'
+    assert str(fetched[('BTC-USD', '5m')]['time'].dt.tz) == 'UTC'
+    assert str(fetched[('EURUSD=X', '1d')]['time'].dt.tz) == 'Europe/London'
+    assert str(fetched[('BTC-USD', '1d')]['time'].dt.tz) == 'UTC'
+
+
+def test_forex_4h_bars_from_a_utc_bulk_download_start_on_london_midnight(fetched):
+    bars = fetched[('USDJPY=X', '4h')]
+    assert (bars['time'].dt.hour % 4 == 0).all()
+    assert bars['time'].iloc[1] == pd.Timestamp('2024-06-03 04:00', tz='Europe/London')
+
+
+def test_naive_daily_dates_are_localised_not_shifted(fetched):
+    assert (fetched[('EURUSD=X', '1d')]['time'].dt.hour == 0).all()
+    assert fetched[('EURUSD=X', '1d')]['time'].iloc[0] == pd.Timestamp('2024-06-03', tz='Europe/London')
+
+
+def test_min_bars_lengthens_each_base_download(monkeypatch):
+    periods = {}
+    def recording_download(symbols, period, interval, **kwargs):
+        periods[interval] = period
+        return fake_download(symbols, period, interval, **kwargs)
+    monkeypatch.setattr(market_data, 'yf', SimpleNamespace(download=recording_download, Ticker=no_single_requests))
+    fetch_watchlist_data(WATCHLIST, min_bars=150)
+    # 5m is the base for USDJPY=X's 4h bars, so it is fetched far enough back for 150 of those
+    assert periods == {'5m': '41d', '1d': '234d'}
+    fetch_watchlist_data(WATCHLIST, only={('BTC-USD', '5m')}, min_bars=150)
+    assert periods['5m'] == '5d'
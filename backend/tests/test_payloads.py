@@ -0,0 +1,21 @@
+import numpy as np
+import pandas as pd
+
+from payloads import frame_to_columns, lttb_indices, records_to_columns
+
+
+def test_times_are_epoch_milliseconds():
+    df = pd.DataFrame({'time': pd.date_range('2024-06-03 09:00', periods=2, freq='60min', tz='Europe/London'), 'close': [1.0, np.nan]})
+    assert frame_to_columns(df) == {'time': [1717401600000, 1717405200000], 'close': [1.0, None]}
+
+
+def test_mixed_timezone_timestamps_are_epoch_milliseconds():
+    records = [{'entry_date': pd.Timestamp('2024-06-03 10:00', tz='Europe/London')}, {'entry_date': pd.Timestamp('2024-06-03 09:00', tz='UTC')}]
+    assert records_to_columns(records, ['entry_date']) == {'entry_date': [1717405200000, 1717405200000]}
+
+
+def test_lttb_keeps_the_ends_and_the_extremes():
+    y = np.zeros(1000); y[123], y[777] = 5.0, -5.0
+    keep = lttb_indices(np.arange(1000), y, 50)
+    assert len(keep) == 50 and keep[0] == 0 and keep[-1] == 999
+    assert 123 in keep and 777 in keep
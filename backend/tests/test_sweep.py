@@ -0,0 +1,29 @@
+import time
+
+import pytest
+
+from backtest import expand_sweep_grid
+
+
+def test_range_is_inclusive_of_stop():
+    grid = expand_sweep_grid({'sweep': {'atrMultiplier': {'start': 1.0, 'stop': 2.0, 'step': 0.5}}}, 100)
+    assert [params['atrMultiplier'] for params in grid] == [1.0, 1.5, 2.0]
+
+
+def test_huge_range_is_rejected_before_building_it():
+    started = time.perf_counter()
+    with pytest.raises(ValueError):
+        expand_sweep_grid({'sweep': {'atrMultiplier': {'start': 0, 'stop': 1e12, 'step': 1e-6}}}, 500)
+    assert time.perf_counter() - started < 0.1
+
+
+def test_axis_limit_accounts_for_earlier_axes():
+    sweep = {'atrMultiplier': [1.0, 1.5, 2.0, 2.5], 'targetMultiplier': {'start': 1, 'stop': 1e9, 'step': 1}}
+    with pytest.raises(ValueError):
+        expand_sweep_grid({'sweep': sweep}, 500)
+
+
+@pytest.mark.parametrize('sweep', [[1, 2], 'atrMultiplier', {'atrMultiplier': {'start': 0, 'stop': float('inf'), 'step': 1}}])
+def test_malformed_sweep_raises_value_error(sweep):
+    with pytest.raises(ValueError):
+        expand_sweep_grid({'sweep': sweep}, 500)
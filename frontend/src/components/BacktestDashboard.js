@@ -12,6 +12,16 @@ const validPeriods = {
     '1d': [{ value: '3mo', label: '3 Months' }, { value: '6mo', label: '6 Months' }, { value: '1y', label: '1 Year' }, { value: '2y', label: '2 Years' }, { value: '5y', label: '5 Years (Max)' }]
 };
 
+// Ask for parallel arrays, an equity curve thinned to roughly the chart's width and only the columns we plot
+const RESPONSE_OPTIONS = { format: 'columnar', equityPoints: 1000, chartColumns: ['time', 'open', 'high', 'low', 'close', 'signal'] };
+
+// {column: [values]} -> [{column: value}]
+const fromColumns = (columns = {}) => {
+    const keys = Object.keys(columns);
+    const length = keys.length ? columns[keys[0]].length : 0;
+    return Array.from({ length }, (_, i) => Object.fromEntries(keys.map(key => [key, columns[key][i]])));
+};
+
 const BacktestDashboard = () => {
     const [config, setConfig] = useState({
         symbol: 'EURUSD=X', timeframe: '60m', period: '6mo', strategy: 'momentum',
@@ -48,7 +58,7 @@ const BacktestDashboard = () => {
                 const response = await fetch(`${backendUrl}/api/backtest`, {
                     method: 'POST',
                     headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify(config),
+                    body: JSON.stringify({ ...config, ...RESPONSE_OPTIONS }),
                 });
                 const data = await response.json();
                 if (!response.ok) throw new Error(data.error || 'Backtest failed');
@@ -57,8 +67,9 @@ const BacktestDashboard = () => {
                     setError(data.error);
                 } else {
                     setPerformance(data.performance);
-                    setTrades(data.trades);
-                    setEquityCurveData(data.equityCurve.map(d => ({
+                    setTrades(fromColumns(data.trades));
+                    setChartData(fromColumns(data.chartData));
+                    setEquityCurveData(fromColumns(data.equityCurve).map(d => ({
                         ...d,
                         time: new Date(d.time).toLocaleDateString()
                     })));
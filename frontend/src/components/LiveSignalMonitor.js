@@ -1,34 +1,77 @@
-import { useState, useEffect, useMemo, useCallback } from 'react';
+import { useState, useEffect, useMemo, useCallback, useRef } from 'react';
 import { Toaster, toast } from 'react-hot-toast';
 import { Filter, RefreshCw, Zap } from 'lucide-react';
 
+const POLL_INTERVAL_MS = 30000;
+
+// Newest first, one entry per trade id; later copies of a trade replace earlier ones
+const mergeTrades = (current, updates) => {
+    const byId = new Map(current.map(t => [t.id, t]));
+    updates.forEach(t => byId.set(t.id, t));
+    return Array.from(byId.values()).sort((a, b) => new Date(b.entry_date) - new Date(a.entry_date));
+};
+
+// Latest entry/exit time across trades, used as the `since` cursor for incremental polls
+const latestChange = (trades, current) => trades.reduce((latest, t) => (
+    [t.entry_date, t.exit_date].filter(Boolean).reduce((acc, d) => Math.max(acc, new Date(d).getTime()), latest)
+), current || 0);
+
 const LiveSignalMonitor = () => {
     const [allTrades, setAllTrades] = useState([]);
     const [filters, setFilters] = useState({ symbol: 'ALL', timeframe: 'ALL' });
     const [loading, setLoading] = useState(true);
+    const [streaming, setStreaming] = useState(false);
+    const lastChangeRef = useRef(null);
 
-    const fetchTradeHistory = useCallback(async () => {
-        setLoading(true);
+    const fetchTradeHistory = useCallback(async ({ incremental = false } = {}) => {
+        if (!incremental) setLoading(true);
         try {
             const backendUrl = process.env.REACT_APP_RENDER_WORKER_URL;
             if (!backendUrl) throw new Error("Worker URL not configured");
-            const historyRes = await fetch(`${backendUrl}/api/live-signals`);
+            // Incremental polls only ask for trades opened or closed since the newest one we have
+            const since = incremental && lastChangeRef.current ? `?since=${encodeURIComponent(new Date(lastChangeRef.current).toISOString())}` : '';
+            const historyRes = await fetch(`${backendUrl}/api/live-signals${since}`);
             if (!historyRes.ok) throw new Error('Failed to fetch from server');
             const historyData = await historyRes.json();
-            setAllTrades(historyData);
+            lastChangeRef.current = latestChange(historyData, lastChangeRef.current);
+            setAllTrades(prev => incremental ? mergeTrades(prev, historyData) : historyData);
         } catch (error) {
             toast.error(`Could not refresh trade history: ${error.message}`);
         } finally {
-            setLoading(false);
+            if (!incremental) setLoading(false);
         }
     }, []);
 
     useEffect(() => {
         fetchTradeHistory();
-        const interval = setInterval(fetchTradeHistory, 30000); // Auto-refresh every 30 seconds
-        return () => clearInterval(interval);
     }, [fetchTradeHistory]);
 
+    // Live updates are pushed by the worker; EventSource reconnects on its own after errors
+    useEffect(() => {
+        const backendUrl = process.env.REACT_APP_RENDER_WORKER_URL;
+        if (!backendUrl || typeof EventSource === 'undefined') return undefined;
+        const source = new EventSource(`${backendUrl}/api/live-signals/stream`);
+        source.onopen = () => {
+            setStreaming(true);
+            // Catch up on anything that changed while we were disconnected
+            fetchTradeHistory({ incremental: true });
+        };
+        source.onerror = () => setStreaming(false);
+        source.addEventListener('signal', (event) => {
+            const { signal } = JSON.parse(event.data);
+            lastChangeRef.current = latestChange([signal], lastChangeRef.current);
+            setAllTrades(prev => mergeTrades(prev, [signal]));
+        });
+        return () => source.close();
+    }, [fetchTradeHistory]);
+
+    // Polling is only the fallback for when the stream is down
+    useEffect(() => {
+        if (streaming) return undefined;
+        const interval = setInterval(() => fetchTradeHistory({ incremental: true }), POLL_INTERVAL_MS);
+        return () => clearInterval(interval);
+    }, [streaming, fetchTradeHistory]);
+
     // This useMemo hook filters the trades based on the dropdown selections
     const filteredTrades = useMemo(() => {
         return allTrades.filter(trade => {
@@ -49,7 +92,7 @@ const LiveSignalMonitor = () => {
                 <div className="bg-gray-800/50 backdrop-blur-sm rounded-xl border border-gray-700 p-6">
                     <div className="flex flex-col md:flex-row justify-between md:items-center mb-4">
                         <h2 className="text-lg font-semibold flex items-center mb-4 md:mb-0"><Zap className="w-5 h-5 mr-2 text-green-400 animate-pulse" />24/7 Live Signal Feed</h2>
-                        <p className="text-sm text-gray-400">Worker is always active. Signals are logged automatically.</p>
+                        <p className="text-sm text-gray-400">Worker is always active. Signals are logged automatically. {streaming ? 'Streaming live updates.' : 'Checking for updates every 30 seconds.'}</p>
                     </div>
                     <div className="grid grid-cols-1 md:grid-cols-3 gap-4 items-end">
                         <div>
@@ -64,7 +107,7 @@ const LiveSignalMonitor = () => {
                                 {uniqueTimeframes.map(t => <option key={t} value={t}>{t === 'ALL' ? 'All Timeframes' : t}</option>)}
                             </select>
                         </div>
-                        <button onClick={fetchTradeHistory} disabled={loading} className="w-full flex items-center justify-center space-x-2 px-4 py-2 bg-blue-600 hover:bg-blue-700 disabled:bg-gray-600 rounded-lg font-medium">
+                        <button onClick={() => fetchTradeHistory()} disabled={loading} className="w-full flex items-center justify-center space-x-2 px-4 py-2 bg-blue-600 hover:bg-blue-700 disabled:bg-gray-600 rounded-lg font-medium">
                             <RefreshCw size={18} className={loading ? 'animate-spin' : ''} />
                             <span>{loading ? 'Refreshing...' : 'Refresh Now'}</span>
                         </button>